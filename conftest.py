@@ -0,0 +1 @@
+# conftest.py - Marks repository root for pytest, so tests can import the scripts package
@@ -0,0 +1,52 @@
+# aggregates.py - Pre-aggregated Value totals ("cube") for answering common pivots without scanning data
+
+import pandas as pd
+
+from scripts.constants import *
+
+CUBE_FIELDS = [F_MOD, F_SCN, F_YER]  # Fields used by predefined plot sets
+CUBE_SUM = 'sum'  # Sum of non-missing values
+CUBE_VALUES = 'values'  # Number of non-missing values
+CUBE_ROWS = 'rows'  # Number of rows
+CUBE_AGGFUNCS = [AGGF_SUM, AGGF_MEAN, AGGF_COUNT, NONE_ITEM]
+
+
+def build_cube(data):
+    """Aggregate Value by each combination of cube fields present in data, or None if cube can't be used"""
+
+    # Rows missing a cube field would be dropped here, yet still count toward pivots not using that field
+    if data[CUBE_FIELDS].isnull().values.any():
+        return None
+
+    grouped = data.groupby(CUBE_FIELDS, observed=True, sort=False)[F_VAL]
+
+    return pd.DataFrame({CUBE_SUM: grouped.sum(),
+                         CUBE_VALUES: grouped.count(),
+                         CUBE_ROWS: grouped.size()}).reset_index()
+
+
+def cube_supports(selection, x_field, pivot_field, y_field, aggfunc):
+    """Can pivot of results for selection (dict of field -> values) be taken from cube?"""
+    return (y_field == F_VAL and aggfunc in CUBE_AGGFUNCS and
+            x_field in CUBE_FIELDS and pivot_field in CUBE_FIELDS and not x_field == pivot_field and
+            all(field in CUBE_FIELDS for field in selection))
+
+
+def pivot_cube(cube, selection, x_field, pivot_field, aggfunc):
+    """Create same pivot table as DataFrame.pivot_table() would from results, but using cube"""
+
+    for field, values in selection.items():
+        cube = cube[cube[field].isin(values)]
+
+    totals = cube.groupby([x_field, pivot_field], observed=True)[[CUBE_SUM, CUBE_VALUES, CUBE_ROWS]].sum()
+
+    if aggfunc == AGGF_SUM:
+        agged = totals[CUBE_SUM]
+    elif aggfunc == AGGF_COUNT:
+        agged = totals[CUBE_ROWS]
+    else:
+        agged = totals[CUBE_SUM] / totals[CUBE_VALUES]  # Mean, NaN where group has no values
+
+    # Mirror pivot_table(): drop empty groups, sort columns, drop empty columns
+    table = agged.dropna().unstack(pivot_field).sort_index(axis=1)
+    return table.dropna(how='all', axis=1)
@@ -11,6 +11,7 @@ F_IND = 'Indicator'
 F_UNI = 'Unit'
 F_VAL = 'Value'
 FIELDS = [F_MOD, F_SCN, F_YER, F_SEC, F_REG, F_IND, F_UNI, F_VAL]
+DIMS = [F_MOD, F_SCN, F_REG, F_IND, F_SEC, F_UNI]  # String (dimension) fields
 
 # For menu items
 ALL = '(All)'
@@ -22,6 +23,10 @@ PLOT_TYPE_BAR = 'bar'
 PLOT_TYPE_HIST = 'hist'
 PLOT_TYPE_BOX = 'box'
 
+# Plot display
+PLOT_BACKEND_STATIC = 'static'  # Matplotlib image
+PLOT_BACKEND_INTERACTIVE = 'interactive'  # Plotly FigureWidget, zoom and pan happen in browser
+
 # Plot "sets" - predefined plots configurations
 PLOT_SET_CUSTOM = 'Custom'
 PLOT_SET_1 = 'Values for Model by Year'
@@ -37,24 +42,43 @@ FILL_LINEAR = 'linear'
 FILL_CUBIC = 'cubicspline'
 FILL_PAD = 'pad (use most recent value)'
 
+# Settings for each plot set, harmonize value PLOT_HARM_FIRST means first value in results. Settings a plot set leaves
+# out are left as user had them, and take PLOT_SET_DEFAULTS when plot sets are drawn for export.
+PLOT_HARM_FIRST = '(first)'
+PLOT_SETS = {
+    PLOT_SET_1: dict(type=PLOT_TYPE_LINE, x=F_YER, y=F_VAL, pivot=F_MOD, aggfunc=AGGF_SUM, fill=FILL_LINEAR),
+    PLOT_SET_2: dict(type=PLOT_TYPE_BAR, x=F_MOD, y=F_VAL, pivot=F_SCN, aggfunc=AGGF_MEAN, fill=NONE_ITEM),
+    PLOT_SET_3: dict(type=PLOT_TYPE_LINE, x=F_YER, y=F_VAL, pivot=F_MOD, aggfunc=AGGF_SUM, fill=FILL_CUBIC,
+                     harm_row=PLOT_HARM_FIRST, harm_col=PLOT_HARM_FIRST)}
+PLOT_SET_DEFAULTS = dict(index=False, harm_row=NONE_ITEM, harm_col=NONE_ITEM)
+
 # Data download formats
 FORMAT_EXT_CSV = '.csv'
+FORMAT_EXT_CSV_GZ = '.csv.gz'
+FORMAT_EXT_CSV_ZST = '.csv.zst'
 FORMAT_EXT_JSON = '.json'
+FORMAT_EXT_JSONL = '.jsonl'
 FORMAT_EXT_HTML = '.html'
 FORMAT_EXT_EXCEL = '.xls'
 FORMAT_EXT_HDF5 = '.h5'
 FORMAT_EXT_PICKLE = '.pickle'
+FORMAT_EXT_PARQUET = '.parquet'
+FORMAT_EXT_FEATHER = '.feather'
 
 # Plot image download formats
 FORMAT_EXT_PNG = '.png'
 FORMAT_EXT_JPG = '.jpg'
 FORMAT_EXT_PDF = '.pdf'
 FORMAT_EXT_SVG = '.svg'
+FORMAT_EXT_ZIP = '.zip'  # Images of all plot sets
 
 # Misc text
 NO_DATA_AVAIL = '(No  data is available. Please select a data file.)'
 NO_RECS_AVAIL = '(No results data is available. Please revise your data selection.)'
 CREATING_LINK = 'Creating link...'
+CREATING_FILE = 'Writing <b>%s</b> of %s records...'
+EXPORT_FAILED = 'Unable to create download file. Please see log for details.'
+NO_PLOT_AVAIL = '(No plot is available. Please create a plot.)'
 DOWNLOAD_DATA_NAME = 'AgMIP_Explorer_Data'
 DOWNLOAD_PLOT_NAME = 'AgMIP_Explorer_Plot'
 FILTER_PROG = 'Searching...'
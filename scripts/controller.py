@@ -1,14 +1,19 @@
 # controller.py - Central logic for scsa notebook
 # rcampbel@purdue.edu - 2020-07-14
 
+import io
 import logging
-import time
 import traceback
+import zipfile
 import warnings  # Avoids warning: "numpy.dtype size changed, may indicate binary incompatibility"
-from matplotlib import pyplot as plt
 from IPython.core.display import display, clear_output
 
+from scripts import export
 from scripts.constants import *
+from scripts.detail import OTHER_MIN, OTHER_MAX
+from scripts.jobs import Job
+from scripts.plotter import Plotter
+from scripts.surface import Surface
 
 warnings.filterwarnings('ignore')  # TODO Confirm still needed?
 
@@ -17,6 +22,9 @@ PLOT_WIDTH = 12  # inches
 PLOT_HEIGHT = 6  # inches
 PLOT_EMPTY_X_AXIS = 'X Axis'
 PLOT_EMPTY_Y_AXIS = 'Y Axis'
+PLOT_OTHER_LABEL = 'Other (%d)'  # Band covering series not drawn individually (see detail.py)
+PLOT_OTHER_COLOR = 'gray'
+PLOT_OTHER_ALPHA = 0.3
 
 
 class CombineLogFields(logging.Filter):
@@ -44,7 +52,11 @@ class Controller(logging.Handler):
             log_format = '%(asctime)s %(message)s'
             log_level = logging.INFO
 
-        self.plot_figure = None
+        self.surface = None  # Figure reused for every plot (see plot_surface())
+        self.plotter = None  # Interactive plot, created when first used
+        self.plotter_shown = False  # Is interactive plot in output widget?
+        self.export_surface = None  # Figure for plot images, never shown (see save_plot())
+        self.plot_shown = None  # (<config>, <title>, <results key>) of plot in output widget
 
         logging.Handler.__init__(self)
         self.logger = logging.getLogger(__name__)
@@ -56,6 +68,8 @@ class Controller(logging.Handler):
 
         self.model = None
         self.view = None
+        self.load_job = None
+        self.export_jobs = {}  # Running export job for each export output area
 
     def intro(self, model, view):
         """Introduce MVC modules to each other"""
@@ -89,16 +103,21 @@ class Controller(logging.Handler):
             #   Methods listed below will be called when user activates widget.
             #   Format: <widget>.on_click/observe(<method_to_be_called>...)
             self.view.data_ddn_src.observe(self.cb_data_source_selected, self.VALUE)
+            self.view.cover_fields.observe(self.cb_coverage_opened, 'selected_index')
             self.view.filter_mod.observe(self.cb_model_selected, self.VALUE)
             self.view.filter_btn_apply.on_click(self.cb_apply_filter)
             self.view.filter_ddn_ndisp.observe(self.cb_ndisp_changed, self.VALUE)
+            self.view.filter_btn_prev.on_click(self.cb_page_prev)
+            self.view.filter_btn_next.on_click(self.cb_page_next)
             self.view.filter_btn_refexp.on_click(self.cb_fill_results_export)
             self.view.viz_ddn_plot_set.observe(self.cb_plot_menu, self.VALUE)
             self.view.viz_btn_plot_generate.on_click(self.cb_plot_button)
+            self.view.viz_ddn_plot_backend.observe(self.cb_plot_backend, self.VALUE)
             self.view.viz_ddn_plot_xaxis.observe(self.cb_refresh_harmonizers, self.VALUE)
             self.view.viz_ddn_plot_pivot.observe(self.cb_refresh_harmonizers, self.VALUE)
             self.view.data_btn_refexp.on_click(self.cb_fill_data_export)
             self.view.viz_btn_plot_refexp.on_click(self.cb_fill_plot_export)
+            self.view.viz_btn_plot_sets_exp.on_click(self.cb_fill_plot_sets_export)
 
         except Exception:
             self.logger.error('EXCEPTION\n' + traceback.format_exc())
@@ -112,14 +131,51 @@ class Controller(logging.Handler):
             choice = change['owner'].value
 
             if not choice == self.view.EMPTY:
+
+                # Newer selection supersedes any load still in progress
+                if self.load_job is not None:
+                    self.load_job.cancel()
+
+                self.view.reset_load_progress()
                 self.view.update_data_status(self.view.DATA_LOAD)
-                self.model.get_data(choice)
-                self.view.update_data_status(self.model.data)
-                self.view.update_dynamic_selections()
+                self.load_job = Job(lambda job: self.model.read_data(
+                                        choice, progress=self.job_progress(job, self.view.update_load_progress)),
+                                    self.load_done, self.load_failed).start()
+        except Exception:
+            self.logger.error('EXCEPTION\n' + traceback.format_exc())
+            raise
+
+    def cb_coverage_opened(self, change):
+        """User opened (or closed) coverage section for a field"""
+        try:
+            self.view.show_coverage(change['new'])
         except Exception:
             self.logger.error('EXCEPTION\n' + traceback.format_exc())
             raise
 
+    def job_progress(self, job, update):
+        """Create progress callback for job that passes progress on to update(), it also stops job if cancelled"""
+
+        def progress(*args):
+            job.check()
+            update(*args)
+
+        return progress
+
+    def load_done(self, loaded):
+        """Background data loading finished, switch to new data"""
+        self.logger.debug('At')
+        self.model.set_data(*loaded)
+        self.view.reset_load_progress()
+        self.view.update_data_status(self.model.data)
+        self.view.update_dynamic_selections()
+
+    def load_failed(self, trace):
+        """Background data loading failed"""
+        self.logger.error('EXCEPTION\n' + trace)
+        self.view.reset_load_progress()
+        self.view.update_data_status(self.view.DATA_LOAD_FAILED)
+
     def cb_model_selected(self, change):
         """User changed their model filter selection"""
         self.logger.debug('At')
@@ -139,7 +195,8 @@ class Controller(logging.Handler):
 
         try:
             self.view.output(FILTER_PROG, self.view.filter_output)
-            self.view.filter_out_export.clear_output()
+            self.cancel_export(self.view.filter_out_export)  # Link would be for previous results
+            self.view.export_msg('', self.view.filter_out_export)
 
             # Use specified criteria to search for data, (results stored in model)
             self.model.clear_filter_results()
@@ -161,6 +218,22 @@ class Controller(logging.Handler):
             self.logger.error('EXCEPTION\n' + traceback.format_exc())
             raise
 
+    def cb_page_prev(self, _):
+        """User hit button to see previous page of results"""
+        try:
+            self.view.update_filtered_output(self.view.filter_page - 1)
+        except Exception:
+            self.logger.error('EXCEPTION\n' + traceback.format_exc())
+            raise
+
+    def cb_page_next(self, _):
+        """User hit button to see next page of results"""
+        try:
+            self.view.update_filtered_output(self.view.filter_page + 1)
+        except Exception:
+            self.logger.error('EXCEPTION\n' + traceback.format_exc())
+            raise
+
     def cb_ndisp_changed(self, _):
         """User changed number of recs to display"""
         try:
@@ -174,34 +247,77 @@ class Controller(logging.Handler):
         self.logger.debug('At')
 
         try:
-            # First, clear _RESULTS_ link because it might point to same file
-            self.view.export_msg('', self.view.filter_out_export)
-
             # Create link for bulk data
             if self.model.valid:
-                self.view.export_msg(CREATING_LINK, self.view.data_out_export)
-                filename = self.model.create_download_file(self.model.data, self.view.data_ddn_format.value)
-                self.view.export_link(filename, self.view.data_out_export)
+                self.start_export(self.view.data_ddn_format.value, False, self.view.data_out_export)
             else:
                 self.view.export_msg(NO_DATA_AVAIL, self.view.data_out_export)
         except Exception:
             self.logger.debug('EXCEPTION\n' + traceback.format_exc())
             raise
 
+    def start_export(self, file_format_ext, results, output):
+        """Create download file of all data (or results) in background, showing progress then link in output"""
+        self.cancel_export(output)  # Newer request for same output area supersedes one in progress
+        self.view.export_msg(CREATING_LINK, output)
+
+        source = self.model.download_source(results)  # Taken now, so later searches don't change what's exported
+
+        def update(rows, total):
+            self.view.export_progress(rows, total, output)
+
+        job = Job(lambda job: self.model.create_download_file(file_format_ext, source,
+                                                              progress=self.job_progress(job, update)),
+                  lambda filename: self.view.export_link(filename, output),
+                  lambda trace: self.export_failed(trace, output))
+        self.export_jobs[output] = job.start()
+
+    def cancel_export(self, output):
+        job = self.export_jobs.pop(output, None)
+
+        if job is not None:
+            job.cancel()
+
+    def export_failed(self, trace, output):
+        """Background export failed"""
+        self.logger.error('EXCEPTION\n' + trace)
+        self.view.export_msg(EXPORT_FAILED, output)
+
     def cb_fill_plot_export(self, _):
         """User hit button to download image of plot"""
         self.logger.debug('At')
 
         try:
-            self.view.export_msg('...', self.view.viz_out_plot_export)
-            time.sleep(1)
+            if self.plot_shown is None:
+                self.view.export_msg(NO_PLOT_AVAIL, self.view.viz_out_plot_export)
+                return
+
+            # Image is saved once for each plot and format, then reused
+            config, title, results_key = self.plot_shown
+            file_format_ext = self.view.viz_ddn_plot_format.value
+            key = (results_key, sorted(config.items()))
+            filename, _ = export.cached(key, DOWNLOAD_PLOT_NAME + file_format_ext,
+                                        lambda target: self.save_plot(config, title, target, file_format_ext))
+            self.view.export_link(filename, self.view.viz_out_plot_export)
+        except Exception:
+            self.logger.debug('EXCEPTION\n' + traceback.format_exc())
+            raise
 
-            # First, to save space, delete existing download file(s)
-            self.model.delete_downloads(DOWNLOAD_PLOT_NAME)
+    def cb_fill_plot_sets_export(self, _):
+        """User hit button to download images of all plot sets"""
+        self.logger.debug('At')
 
-            # Create link for image file
-            filename = DOWNLOAD_DATA_NAME + self.view.viz_ddn_plot_format.value
-            self.plot_figure.savefig(filename)
+        try:
+            if self.model.res_row_count == 0:
+                self.view.export_msg(NO_RECS_AVAIL, self.view.viz_out_plot_export)
+                return
+
+            self.view.export_msg(CREATING_LINK, self.view.viz_out_plot_export)
+            file_format_ext = self.view.viz_ddn_plot_format.value
+            key = (self.model.results_key(), sorted(PLOT_SET_DEFAULTS.items()),
+                   sorted((choice, sorted(config.items())) for choice, config in PLOT_SETS.items()))
+            filename, _ = export.cached(key, DOWNLOAD_PLOT_NAME + file_format_ext + FORMAT_EXT_ZIP,
+                                        lambda target: self.save_plot_sets(file_format_ext, target))
             self.view.export_link(filename, self.view.viz_out_plot_export)
         except Exception:
             self.logger.debug('EXCEPTION\n' + traceback.format_exc())
@@ -212,14 +328,9 @@ class Controller(logging.Handler):
         self.logger.debug('At')
 
         try:
-            # First, clear _DATA_ link because it might point to same file
-            self.view.export_msg('', self.view.data_out_export)
-
             # Create link for filter results
             if self.model.res_row_count > 0:
-                self.view.export_msg(CREATING_LINK, self.view.filter_out_export)
-                filename = self.model.create_download_file(self.model.results, self.view.filter_ddn_format.value)
-                self.view.export_link(filename, self.view.filter_out_export)
+                self.start_export(self.view.filter_ddn_format.value, True, self.view.filter_out_export)
             else:
                 self.view.export_msg(NO_RECS_AVAIL, self.view.filter_out_export)
         except Exception:
@@ -258,29 +369,71 @@ class Controller(logging.Handler):
             self.empty_plot(error=True)
             self.logger.debug('EXCEPTION\n' + traceback.format_exc())
 
+    def cb_plot_backend(self, _):
+        """User switched between static and interactive plots"""
+        # noinspection PyBroadException
+        try:
+            if not self.view.viz_btn_plot_generate.disabled:
+                self.process_and_plot()  # Processing steps are reused, so this just redraws
+        except Exception:
+            self.empty_plot(error=True)
+            self.logger.debug('EXCEPTION\n' + traceback.format_exc())
+
+    def plot_config(self):
+        """Get plot settings from widgets, as dict like those in PLOT_SETS"""
+        return dict(type=self.view.viz_ddn_plot_type.value,
+                    x=self.view.viz_ddn_plot_xaxis.value,
+                    y=self.view.viz_ddn_plot_yaxis.value,
+                    pivot=self.view.viz_ddn_plot_pivot.value,
+                    aggfunc=self.view.viz_ddn_plot_aggfunc.value,
+                    fill=self.view.viz_ddn_plot_fill.value,
+                    index=self.view.viz_ckb_plot_index.value,
+                    harm_row=self.view.viz_ddn_plot_harm_row.value,
+                    harm_col=self.view.viz_ddn_plot_harm_col.value)
+
+    def plot_set_config(self, choice):
+        """Get settings for plot set, with harmonize values filled in from results"""
+        config = dict(PLOT_SETS[choice])
+
+        for harm, field in [('harm_row', config['x']), ('harm_col', config['pivot'])]:
+
+            if config.get(harm) == PLOT_HARM_FIRST:
+                config[harm] = self.model.get_uniques_for(field)[0]
+
+        return config
+
     def process_and_plot(self):
         """Process data and plot it"""
         self.logger.debug('At')
+        config = self.plot_config()
 
-        x = self.view.viz_ddn_plot_xaxis.value
-        y = self.view.viz_ddn_plot_yaxis.value
-        pivot = self.view.viz_ddn_plot_pivot.value
-        fill = self.view.viz_ddn_plot_fill.value
-        harm_row = self.view.viz_ddn_plot_harm_row.value
-        harm_col = self.view.viz_ddn_plot_harm_col.value
-
-        # Specify numeric axis(es)
-        numeric_xy = (x == F_VAL or x == F_YER,
-                      y == F_VAL or y == F_YER)
+        # Clear pivot table data
+        with self.view.viz_out_plot_data:
+            clear_output(wait=True)
 
-        # Plot will be based on model's "processed" data
-        self.model.init_processed()
+        title = self.process(config)
 
-        # Clear pivot table data
+        # Show plot data
         with self.view.viz_out_plot_data:
+            self.model.set_disp(self.model.processed, wide=True)
             clear_output(wait=True)
+            display(self.model.processed)
+
+        # Draw plot based on processed data
+        self.draw_plot(config, title)
+
+    def process(self, config):
+        """Set model's processed data for plot settings, return plot title"""
+        x = config['x']
+        y = config['y']
+        pivot = config['pivot']
+        fill = config['fill']
+        harm_row = config['harm_row']
+        harm_col = config['harm_col']
 
-        self.model.pivot(x, pivot, y, self.view.viz_ddn_plot_aggfunc.value)
+        # Plot will be based on model's "processed" data
+        self.model.init_processed()
+        self.model.pivot(x, pivot, y, config['aggfunc'])
 
         # Fill missing values (interpolate)?
         if not fill == NONE_ITEM:
@@ -290,7 +443,7 @@ class Controller(logging.Handler):
 
         indexed_by = None
 
-        if self.view.viz_ckb_plot_index.value:
+        if config['index']:
 
             if x == F_YER and not harm_row == NONE_ITEM:
                 indexed_by = harm_row
@@ -328,47 +481,57 @@ class Controller(logging.Handler):
             title += ', Harmonized: ' + str(harm_row) + ', ' + str(harm_col)
 
         self.model.dropna()
+        return title
 
-        # Show plot data
-        with self.view.viz_out_plot_data:
-            self.model.set_disp(self.model.processed, wide=True)
-            clear_output(wait=True)
-            display(self.model.processed)
+    def draw_interactive(self, config, title):
+        """Update interactive plot's traces in place, showing it in output widget if not already there"""
+        self.logger.debug('At')
 
-        # Draw plot based on processed data
-        self.draw_plot(title, x, y, numeric_xy)
+        if self.plotter is None:
+            self.plotter = Plotter(self.model)
+
+        self.plotter.draw_processed(config['type'], title, config['x'], config['y'])
+
+        if not self.plotter_shown:
+
+            with self.view.viz_out_plot_output:
+                clear_output(wait=True)
+                display(self.plotter.fig)
+
+            self.plotter_shown = True
 
     def set_plot_config(self, choice):
         """Update plot options"""
         self.logger.debug('At, choice='+str(choice))
+        config = self.plot_set_config(choice)
+
+        self.view.viz_ddn_plot_type.value = config['type']
+        self.view.viz_ddn_plot_xaxis.value = config['x']
+        self.view.viz_ddn_plot_yaxis.value = config['y']
+        self.view.viz_ddn_plot_pivot.value = config['pivot']
+        self.view.viz_ddn_plot_aggfunc.value = config['aggfunc']
+        self.view.viz_ddn_plot_fill.value = config['fill']
+
+        # Settings plot set doesn't have are left as they are
+        if 'index' in config:
+            self.view.viz_ckb_plot_index.value = config['index']
+        if 'harm_row' in config:
+            self.view.viz_ddn_plot_harm_row.value = config['harm_row']
+        if 'harm_col' in config:
+            self.view.viz_ddn_plot_harm_col.value = config['harm_col']
 
-        if choice == PLOT_SET_1:
-            self.view.viz_ddn_plot_type.value = PLOT_TYPE_LINE
-            self.view.viz_ddn_plot_xaxis.value = F_YER
-            self.view.viz_ddn_plot_yaxis.value = F_VAL
-            self.view.viz_ddn_plot_pivot.value = F_MOD
-            self.view.viz_ddn_plot_aggfunc.value = AGGF_SUM
-            self.view.viz_ddn_plot_fill.value = FILL_LINEAR
-        elif choice == PLOT_SET_2:
-            self.view.viz_ddn_plot_type.value = PLOT_TYPE_BAR
-            self.view.viz_ddn_plot_xaxis.value = F_MOD
-            self.view.viz_ddn_plot_yaxis.value = F_VAL
-            self.view.viz_ddn_plot_pivot.value = F_SCN
-            self.view.viz_ddn_plot_aggfunc.value = AGGF_MEAN
-            self.view.viz_ddn_plot_fill.value = NONE_ITEM
-        elif choice == PLOT_SET_3:
-            self.view.viz_ddn_plot_type.value = PLOT_TYPE_LINE
-            self.view.viz_ddn_plot_xaxis.value = F_YER
-            self.view.viz_ddn_plot_yaxis.value = F_VAL
-            self.view.viz_ddn_plot_pivot.value = F_MOD
-            self.view.viz_ddn_plot_aggfunc.value = AGGF_SUM
-            self.view.viz_ddn_plot_fill.value = FILL_CUBIC
-            self.view.viz_ddn_plot_harm_row.value = self.view.viz_ddn_plot_harm_row.options[1]
-            self.view.viz_ddn_plot_harm_col.value = self.view.viz_ddn_plot_harm_col.options[1]
+    def plot_surface(self):
+        """Get figure surface for plot output, created on first use then reused for every plot"""
+
+        if self.surface is None:
+            self.surface = Surface(self.view.viz_out_plot_output, (PLOT_WIDTH, PLOT_HEIGHT))
+
+        return self.surface
 
     def empty_plot(self, error=None):
         """Display empty plot frame, with optional error message, in provided output widget"""
         self.logger.debug('At, error='+str(error))
+        self.plot_shown = None
 
         # noinspection PyBroadException
         try:
@@ -377,60 +540,101 @@ class Controller(logging.Handler):
             else:
                 title = 'Plot'
 
-            with self.view.viz_out_plot_output:
-                clear_output(wait=True)
-                print()
-                fig, ax = plt.subplots(figsize=(PLOT_WIDTH, PLOT_HEIGHT))
-                ax.set_xlabel(PLOT_EMPTY_X_AXIS)
-                ax.set_ylabel(PLOT_EMPTY_Y_AXIS)
-                plt.title(title)
-                plt.grid()
-                self.plot_figure = plt.gcf()
-                plt.show()
+            ax = self.plot_surface().axes()
+            ax.set_xlabel(PLOT_EMPTY_X_AXIS)
+            ax.set_ylabel(PLOT_EMPTY_Y_AXIS)
+            ax.set_title(title)
+            ax.grid()
+            self.surface.show()
+            self.plotter_shown = False
         except Exception:
-            plt.close()  # Clear any partial plot output
+            self.plot_surface().axes()  # Clear any partial plot
             self.logger.debug('raising exception')
             raise
 
-    def draw_plot(self, title, x_label, y_label, numeric_xy):
+    def draw_plot(self, config, title):
         """Create plot image and display it in provided output widget"""
-        self.logger.debug('title=%s labels="%s","%s" num-xy=%s' % (title, x_label, y_label, str(numeric_xy)))
+        self.logger.debug('title=%s config=%s' % (title, str(config)))
+        self.plot_shown = None
 
-        # noinspection PyBroadException
-        try:
-            with self.view.viz_out_plot_output:
-                # Clear existing plot output, including previous error msg
-                clear_output(wait=True)
-                print()
+        if self.view.viz_ddn_plot_backend.value == PLOT_BACKEND_INTERACTIVE:
+            self.draw_interactive(config, title)
+        else:
+            # noinspection PyBroadException
+            try:
+                self.render_plot(self.plot_surface().axes(), config, title)
+
+                # Update output widget with new plot, replacing previous plot or error msg
+                self.surface.show()
+                self.plotter_shown = False
+                self.logger.debug('after show()')
+            except Exception:
+                self.plot_surface().axes()  # Clear any partial plot
+                self.logger.debug('raising exception')
+                raise
+
+        self.plot_shown = (config, title, self.model.results_key())
+
+    def render_plot(self, ax, config, title):
+        """Draw processed data on axes - NOTE Assumes data is pandas datatframe"""
+        x_label = config['x']
+        y_label = config['y']
 
-                # Render plot - NOTE Assumes data is pandas datatframe TODO Abstract that?
+        # Specify numeric axis(es)
+        numeric_xy = (x_label == F_VAL or x_label == F_YER,
+                      y_label == F_VAL or y_label == F_YER)
+
+        if config['type'] == PLOT_TYPE_LINE:
+            # Draw reduced copy of data, markers only when all points are present
+            shown, other = self.model.plot_data()
+            full = shown.shape[0] == self.model.processed.shape[0]
+            shown.plot(kind=PLOT_TYPE_LINE,
+                       ax=ax, grid=True, title=title,
+                       marker=PLOT_LINE_DATA_MARKER if full else None)
+
+            if other is not None:
+                # Non-numeric x values are plotted at positions 0, 1, ...
+                x = other.index if numeric_xy[0] else range(other.shape[0])
+                count = self.model.processed.shape[1] - shown.shape[1]
+                ax.fill_between(x, other[OTHER_MIN], other[OTHER_MAX], color=PLOT_OTHER_COLOR,
+                                alpha=PLOT_OTHER_ALPHA, label=PLOT_OTHER_LABEL % count)
+                ax.legend()
+        else:
+            self.model.processed.plot(kind=config['type'],
+                                      ax=ax, grid=True, title=title)
+        # Label axes
+        ax.set_xlabel(x_label)
+        ax.set_ylabel(y_label)
 
-                fig, ax = plt.subplots()
+        # Avoid scientific notation for limits on numeric axis(es)
+        if numeric_xy[0]:
+            ax.ticklabel_format(axis='x', useOffset=False, style='plain')
+        if numeric_xy[1]:
+            ax.ticklabel_format(axis='y', useOffset=False, style='plain')
 
-                if self.view.viz_ddn_plot_type.value == PLOT_TYPE_LINE:
-                    self.model.processed.plot(kind=PLOT_TYPE_LINE,
-                                              ax=ax, grid=True, title=title,
-                                              figsize=(PLOT_WIDTH, PLOT_HEIGHT),
-                                              marker=PLOT_LINE_DATA_MARKER)
-                else:
-                    self.model.processed.plot(kind=self.view.viz_ddn_plot_type.value,
-                                              ax=ax, grid=True, title=title,
-                                              figsize=(PLOT_WIDTH, PLOT_HEIGHT))
-                # Label axes
-                ax.set_xlabel(x_label)
-                ax.set_ylabel(y_label)
-
-                # Avoid scientific notation for limits on numeric axis(es)
-                if numeric_xy[0]:
-                    ax.ticklabel_format(axis='x', useOffset=False, style='plain')
-                if numeric_xy[1]:
-                    ax.ticklabel_format(axis='y', useOffset=False, style='plain')
-
-                # Update output widget with new plot
-                self.plot_figure = plt.gcf()
-                plt.show()
-                self.logger.debug('after plt.show()')
-        except Exception:
-            plt.close()  # Clear any partial plot output
-            self.logger.debug('raising exception')
-            raise
+    def save_plot(self, config, title, target, file_format_ext):
+        """Draw processed data on export figure (never shown) and save it to target (filename or file object)"""
+
+        if self.export_surface is None:
+            self.export_surface = Surface(None, (PLOT_WIDTH, PLOT_HEIGHT))
+
+        self.render_plot(self.export_surface.axes(), config, title)
+        self.export_surface.figure.savefig(target, format=file_format_ext[1:])
+
+    def save_plot_sets(self, file_format_ext, filename):
+        """Write zip file holding image of each plot set"""
+
+        # Data for plot in output widget, put back afterwards even if a plot set fails
+        shown = (self.model.processed, self.model.stage_key)
+
+        try:
+            with zipfile.ZipFile(filename, 'w') as archive:
+
+                for choice in PLOT_SETS:
+                    config = dict(PLOT_SET_DEFAULTS, **self.plot_set_config(choice))
+                    title = self.process(config)
+                    image = io.BytesIO()
+                    self.save_plot(config, title, image, file_format_ext)
+                    archive.writestr(choice + file_format_ext, image.getvalue())
+        finally:
+            self.model.processed, self.model.stage_key = shown
@@ -0,0 +1,59 @@
+# detail.py - Level of detail reduction of processed tables, so large line plots stay quick to draw and readable
+
+import numpy as np
+import pandas as pd
+
+MAX_SERIES = 20  # Series drawn individually, any others are drawn together as one band
+MAX_POINTS = 1000  # Rows kept in all (min and max of each series per bucket), about one per pixel column
+OTHER_MIN = 'min'
+OTHER_MAX = 'max'
+
+
+def split_series(table, limit):
+    """Get (<table of largest series>, <min/max band of other series, or None>)"""
+
+    if table.shape[1] <= limit:
+        return table, None
+
+    keep = table.abs().mean().nlargest(limit).index
+    shown = table[[column for column in table.columns if column in keep]]  # Keeps original column order
+    rest = table[[column for column in table.columns if column not in keep]]
+    return shown, pd.DataFrame({OTHER_MIN: rest.min(axis=1), OTHER_MAX: rest.max(axis=1)})
+
+
+def bucket_rows(values, buckets):
+    """Sorted positions of rows holding each column's min and max within each of given number of row buckets"""
+    rows, columns = values.shape
+    size = -(-rows // buckets)
+
+    # Lay rows out as (bucket, row in bucket, column), padding last bucket with missing values
+    padded = np.full((buckets * size, columns), np.nan)
+    padded[:rows] = values
+    padded = padded.reshape(buckets, size, columns)
+    missing = np.isnan(padded)
+    starts = (np.arange(buckets) * size)[:, np.newaxis]
+
+    lows = np.where(missing, np.inf, padded).argmin(axis=1) + starts
+    highs = np.where(missing, -np.inf, padded).argmax(axis=1) + starts
+    positions = np.unique(np.concatenate([lows.ravel(), highs.ravel(), [0, rows - 1]]))
+    return positions[positions < rows]
+
+
+def reduce(table, max_series=MAX_SERIES, max_points=MAX_POINTS):
+    """Get (<shown>, <other>) for plotting table: its largest series and min/max band of the rest (see split_series())
+
+    Long tables are cut down to rows holding any series' extremes in each bucket, so peaks and dips still show. Each
+    bucket keeps up to two rows per series, so there are max_points / (2 * <series>) buckets. Table itself is left
+    unchanged.
+    """
+    shown, other = split_series(table, max_series)
+
+    if table.shape[0] > max_points:
+        values = shown.values if other is None else np.hstack([shown.values, other.values])
+        positions = bucket_rows(values.astype(float), max(1, max_points // (2 * values.shape[1])))
+        shown = shown.iloc[positions]
+
+        if other is not None:
+            other = other.iloc[positions]
+
+    return shown, other
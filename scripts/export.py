@@ -0,0 +1,203 @@
+# export.py - Writing of download files (in fixed-size chunks where format allows) and cache of written files
+
+import csv
+import glob
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from scripts.constants import *
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CHUNK_ROWS = 100000  # Rows converted to text at a time
+STREAMED_FORMATS = [FORMAT_EXT_CSV, FORMAT_EXT_JSONL, FORMAT_EXT_HTML]
+ARROW_FORMATS = [FORMAT_EXT_PARQUET, FORMAT_EXT_FEATHER]
+ZSTD_LEVEL = 10  # Much smaller than gzip yet still quick to write
+CACHE_DIR = 'downloads'  # Export cache, one subdirectory per file
+CACHE_BYTES = 4 * 1024 ** 3  # Least recently used files are removed once cache grows past this
+
+
+def supports(file_format_ext):
+    """Are libraries needed to write given format installed?"""
+
+    if file_format_ext in ARROW_FORMATS:
+        return pa is not None
+    elif file_format_ext == FORMAT_EXT_CSV_ZST:
+        return zstandard is not None
+
+    return True
+
+
+def chunks(data, progress=None):
+    """Yield (start, <rows>) for successive slices of data, reporting progress(rows_done, rows_total) after each"""
+    total = data.shape[0]
+
+    for start in range(0, max(total, 1), CHUNK_ROWS):  # Empty data still yields once, for headers
+        yield start, data.iloc[start:start + CHUNK_ROWS]
+
+        if progress is not None:
+            progress(min(start + CHUNK_ROWS, total), total)
+
+
+def write_csv(data, f, progress=None):
+    for start, chunk in chunks(data, progress):
+        chunk.to_csv(f, index=False, header=(start == 0), quoting=csv.QUOTE_NONNUMERIC)
+
+
+def write_jsonl(data, f, progress=None):
+    for _, chunk in chunks(data, progress):
+        text = chunk.to_json(orient='records', lines=True)
+
+        if text:
+            f.write(text if text.endswith('\n') else text + '\n')  # Older pandas omits final newline
+
+
+def write_html(data, f, progress=None):
+    """Write one table: header from empty frame, then body rows of each chunk"""
+    start_tag = '<tbody>'
+    end_tag = '</tbody>'
+
+    html = data.iloc[:0].to_html(index=False)
+    f.write(html[:html.index(start_tag) + len(start_tag)] + '\n')
+
+    for _, chunk in chunks(data, progress):
+        html = chunk.to_html(index=False, header=False)
+        f.write(html[html.index(start_tag) + len(start_tag):html.rindex(end_tag)].lstrip('\n').rstrip(' '))
+
+    f.write('  ' + end_tag + '\n</table>')
+
+
+def write_parquet(data, filename, progress=None):
+    """Write each chunk as a row group, so file is built without converting all data at once"""
+    writer = None
+
+    try:
+        for _, chunk in chunks(data, progress):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+            if writer is None:
+                writer = pq.ParquetWriter(filename, table.schema)
+
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_file(data, filename, file_format_ext, progress=None):
+    """Write data to file in given format, reporting progress(rows_done, rows_total) for streamed formats"""
+
+    if file_format_ext in STREAMED_FORMATS:
+
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+
+            if file_format_ext == FORMAT_EXT_CSV:
+                write_csv(data, f, progress)
+            elif file_format_ext == FORMAT_EXT_JSONL:
+                write_jsonl(data, f, progress)
+            elif file_format_ext == FORMAT_EXT_HTML:
+                write_html(data, f, progress)
+
+    elif file_format_ext == FORMAT_EXT_CSV_GZ:
+
+        with gzip.open(filename, 'wt', newline='', encoding='utf-8') as f:
+            write_csv(data, f, progress)
+
+    elif file_format_ext == FORMAT_EXT_CSV_ZST:
+
+        with open(filename, 'wb') as raw:
+            compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+
+            with io.TextIOWrapper(compressor.stream_writer(raw), newline='', encoding='utf-8') as f:
+                write_csv(data, f, progress)
+
+    elif file_format_ext == FORMAT_EXT_PARQUET:
+        write_parquet(data, filename, progress)
+    elif file_format_ext == FORMAT_EXT_FEATHER:
+        data.reset_index(drop=True).to_feather(filename)  # Feather requires default index
+    elif file_format_ext == FORMAT_EXT_JSON:
+        data.to_json(filename, orient='table', index=False)
+    elif file_format_ext == FORMAT_EXT_EXCEL:
+        data.to_excel(filename, index=False)
+    elif file_format_ext == FORMAT_EXT_HDF5:
+        data.to_hdf(filename, key='AgMIP', format='table')  # Fixed format can't store categories
+    elif file_format_ext == FORMAT_EXT_PICKLE:
+        data.to_pickle(filename)
+
+
+def cache_path(key, name):
+    """Where file of given name for contents identified by key is kept in export cache"""
+    digest = hashlib.md5(repr((key, name)).encode('utf-8')).hexdigest()
+    return os.path.join(CACHE_DIR, digest, name)
+
+
+def cached(key, name, write):
+    """Get (filename, <was cached?>) for file of given name identified by key, calling write(<path>) if not cached"""
+    filename = cache_path(key, name)
+
+    if os.path.exists(filename):
+        os.utime(filename)  # Mark as recently used
+        return filename, True
+
+    # Write to temporary directory (hidden from evict()) then move into place, so partial files are never used
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix='.', dir=CACHE_DIR)
+
+    try:
+        temp_file = os.path.join(temp_dir, name)
+        write(temp_file)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        os.replace(temp_file, filename)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    evict(keep=filename)
+    return filename, False
+
+
+def cached_file(data, key, file_format_ext, progress=None):
+    """Get (filename, <was cached?>) for download file of data identified by key, writing file only if not cached"""
+    return cached(key, DOWNLOAD_DATA_NAME + file_format_ext,
+                  lambda filename: write_file(data, filename, file_format_ext, progress))
+
+
+def evict(keep):
+    """Remove least recently used files until export cache fits in CACHE_BYTES, never removing keep"""
+    files = []
+
+    for filename in glob.glob(os.path.join(CACHE_DIR, '*', '*')):
+        try:
+            info = os.stat(filename)
+            files.append((info.st_mtime, info.st_size, filename))
+        except OSError:
+            pass  # Removed meanwhile
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+
+    for _, size, filename in files:
+
+        if total <= CACHE_BYTES:
+            break
+
+        if not filename == keep:
+            total -= size
+
+            try:
+                os.remove(filename)
+                os.rmdir(os.path.dirname(filename))
+            except OSError:
+                pass  # Removed meanwhile
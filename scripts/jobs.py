@@ -0,0 +1,55 @@
+# jobs.py - Background jobs for long-running work, so widget callbacks return immediately
+
+import threading
+import traceback
+
+
+class Cancelled(Exception):
+    """Raised within a job's work once the job has been cancelled"""
+
+
+class Job:
+    """Run work(job) on a background thread, then pass its result to done() or a traceback to failed()
+
+    Work should call job.check() now and then so that cancel() can stop it early. Once cancel() returns,
+    neither done() nor failed() will be called.
+    """
+
+    def __init__(self, work, done, failed):
+        self.work = work
+        self.done = done
+        self.failed = failed
+        self.cancelled = False
+        self.lock = threading.RLock()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        with self.lock:  # Waits for any done()/failed() call in progress
+            self.cancelled = True
+
+    def check(self):
+        if self.cancelled:
+            raise Cancelled()
+
+    def running(self):
+        return self.thread.is_alive()
+
+    def run(self):
+        # noinspection PyBroadException
+        try:
+            result = self.work(self)
+
+            with self.lock:
+                self.check()
+                self.done(result)
+        except Cancelled:
+            pass
+        except Exception:
+            with self.lock:
+
+                if not self.cancelled:
+                    self.failed(traceback.format_exc())
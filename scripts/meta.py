@@ -0,0 +1,153 @@
+# meta.py - Metadata sidecar (unique field values per model) for AgMIP Explorer data files
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from scripts import store
+from scripts.constants import *
+
+META_EXT = '.p'
+META_FIELDS = [F_SCN, F_YER, F_SEC, F_REG, F_IND, F_UNI]
+TAIL_SIZE = 4096  # Bytes at end of file used to recognize appends
+
+
+def meta_name(data_file):
+    return os.path.splitext(data_file)[0] + META_EXT
+
+
+def build(data):
+    """Get (models, uniques) for frame, where uniques[field][model] = <set>, model '' meaning all models"""
+    model_codes, models = pd.factorize(data[F_MOD])
+    models = models.tolist()
+    uniques = {}
+
+    for field in META_FIELDS:
+        codes, values = pd.factorize(data[field])  # Missing values get code -1
+        values = values.tolist()
+
+        # Group rows by (model, value) code pair, skipping rows where either is missing
+        present = (model_codes >= 0) & (codes >= 0)
+        pairs = pd.unique(model_codes[present].astype(np.int64) * len(values) + codes[present])
+
+        field_uniques = dict((model, set()) for model in models)
+
+        for model_code, code in zip(*np.divmod(pairs, len(values))):
+            field_uniques[models[model_code]].add(values[code])
+
+        field_uniques[''] = set(values)
+        uniques[field] = field_uniques
+
+    return set(models), uniques
+
+
+def merge(first, second):
+    """Combine two (models, uniques) results"""
+    models = first[0] | second[0]
+    uniques = {}
+
+    for field in META_FIELDS:
+        uniques[field] = {}
+
+        for model in models | {''}:
+            uniques[field][model] = first[1][field].get(model, set()) | second[1][field].get(model, set())
+
+    return models, uniques
+
+
+def tail_digest(data_file, size):
+    """Fingerprint of the bytes just before given offset in file"""
+    with open(data_file, 'rb') as f:
+        f.seek(max(0, size - TAIL_SIZE))
+        return hashlib.md5(f.read(size - f.tell())).hexdigest()
+
+
+def file_state(data_file):
+    size, mtime = store.signature(data_file)
+    return {'size': size, 'mtime': mtime, 'tail': tail_digest(data_file, size)}
+
+
+def read(data_file):
+    """Get (models, uniques, state) from sidecar, state is None for sidecars from older versions"""
+    with open(meta_name(data_file), 'rb') as f:
+        contents = pickle.load(f)
+
+    return contents if len(contents) == 3 else contents + (None,)
+
+
+def load(data_file):
+    """Get (models, uniques) from sidecar, or None if sidecar is missing or doesn't match data file"""
+
+    # noinspection PyBroadException
+    try:
+        models, uniques, state = read(data_file)
+    except Exception:
+        return None
+
+    if state is None or not (state['size'], state['mtime']) == store.signature(data_file):
+        return None
+
+    return models, uniques
+
+
+def save(data_file, models, uniques, state):
+    with open(meta_name(data_file), 'wb') as f:
+        pickle.dump((models, uniques, state), f, pickle.HIGHEST_PROTOCOL)
+
+
+def appended_rows(data_file, state):
+    """Read rows added to file since state was recorded, or None if file changed in some other way"""
+    size = os.path.getsize(data_file)
+
+    if state is None or size <= state['size'] or not tail_digest(data_file, state['size']) == state['tail']:
+        return None
+
+    with open(data_file, 'rb') as f:
+        f.seek(state['size'] - 1)
+
+        if not f.read(1) == b'\n':
+            return None  # Previous end of file was mid-line
+
+        columns = pd.read_csv(data_file, nrows=0).columns
+        return store.compact_year(pd.read_csv(f, header=None, names=columns, dtype=store.DTYPES))
+
+
+def update(data_file):
+    """Build or incrementally update sidecar for data file, return description of what was done"""
+    state = file_state(data_file)
+
+    if os.path.exists(meta_name(data_file)):
+        models, uniques, old_state = read(data_file)
+
+        if old_state == state:
+            return 'unchanged'
+
+        rows = appended_rows(data_file, old_state)
+
+        if rows is not None:
+            save(data_file, *merge((models, uniques), build(rows)), state=state)
+            return 'updated with %d appended rows' % rows.shape[0]
+
+    data = store.load_cache(data_file)
+
+    if data is not None:
+        save(data_file, *build(data), state=state)
+        return 'built from %d rows' % data.shape[0]
+
+    # Build from one batch of rows at a time, so whole file is never held in memory
+    metadata = None
+    rows = 0
+
+    for chunk, _, _ in store.read_chunks(data_file):
+        chunk_metadata = build(chunk)
+        metadata = chunk_metadata if metadata is None else merge(metadata, chunk_metadata)
+        rows += chunk.shape[0]
+
+    if metadata is None:
+        metadata = build(store.read_csv(data_file))  # Header only
+
+    save(data_file, *metadata, state=state)
+    return 'built from %d rows' % rows
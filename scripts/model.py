@@ -3,12 +3,19 @@
 
 import glob
 import os
-import pickle
+import threading
 import time
-import csv
+from collections import OrderedDict
 
+import numpy as np
 import pandas as pd
 
+from scripts import detail
+from scripts import export
+from scripts import meta
+from scripts import store
+from scripts.aggregates import build_cube, cube_supports, pivot_cube
+from scripts.search import index_data
 from scripts.constants import *
 
 
@@ -16,15 +23,34 @@ def count(series):
     return len(series)
 
 
+def selection_key(selection):
+    """Normalized, hashable form of selection (dict of field -> values)"""
+    return tuple(sorted((field, tuple(sorted(values))) for field, values in selection.items()))
+
+
 class Model:
     DATA_DIR = 'data'
+    SHARED_STORE = True  # Map data from store shared by all sessions (see store.load_shared), else use cache
     FLOAT_FORMAT = '0,.4f'
+    USE_CUBE = True  # Answer common pivots from pre-aggregated totals when possible (see aggregates.py)
+    STAGE_LIMIT = 16  # Number of processed (pivoted, filled, ...) tables kept for reuse
+    SEARCH_LIMIT = 32  # Number of recent searches whose matching rows are kept for reuse
+    SEARCH_BYTES = 64 * 1024 ** 2  # Total size of kept positions, broad searches of large data are kept only briefly
 
     def __init__(self):
         self.view = None
         self.ctrl = None
+        self.lock = threading.RLock()  # Held while switching to new data (loaded in background) or reading it
         self.data = None
+        self.source = None  # Identifies loaded data file and its version
+        self.search_index = None
+        self.searches = OrderedDict()  # Positions of rows matching recent searches, by selection_key()
+        self.cube = None
         self.results = None
+        self.selection = None  # Criteria for current results, dict of field -> values
+        self.res_cube = None  # Cube of data results came from
+        self.res_source = None  # Source of data results came from
+        self.res_version = 0  # Identifies current results, for reuse of processed tables
         self.res_row_count = 0
         self.res_csv = None
         self.headers = ''
@@ -33,85 +59,213 @@ class Model:
         self.uniques = {}
         self.mods = set()
         self.processed = None
+        self.stages = OrderedDict()  # Processed tables, by (<results version>, <step>, <step>, ...)
+        self.stage_key = None
 
     def intro(self, view, ctrl):
         """Introduce MVC modules to each other"""
         self.view = view
         self.ctrl = ctrl
 
-    def get_data(self, data_file):
+    def get_data(self, data_file, progress=None):
         """Load data from file (init data access)"""
+        self.set_data(*self.read_data(data_file, progress))
+
+    def read_data(self, data_file, progress=None):
+        """Get (data, index, cube, models, uniques, source) for file, where source identifies file's version
+
+        Progress is reported via optional progress(rows, bytes_read, bytes_total). Model is left unchanged (see
+        set_data()), so this can run in the background while current data is in use.
+        """
         self.ctrl.logger.debug('At')
-        self.data = pd.read_csv(data_file)
-        self.mods, self.uniques = pickle.load(open(os.path.splitext(data_file)[0] + '.p', 'rb'))
-        self.valid = True
+        state = meta.file_state(data_file)  # Taken first, so caches built below are never newer than data
+        metadata = meta.load(data_file)
+        build_metadata = metadata is None
+
+        if build_metadata:
+            self.ctrl.logger.info('Building metadata for data file "' + data_file + '"')
+
+        shared = store.load_shared(data_file) if self.SHARED_STORE else None
+
+        if shared is not None:
+            data, search_index = shared
+            self.ctrl.logger.info('Using shared store for data file "' + data_file + '"')
+        else:
+            data = None if self.SHARED_STORE else store.load_cache(data_file)
+
+            if data is None:
+                # Cache missing or stale: parse CSV
+                data, metadata = self.parse_data(data_file, metadata, progress)
+
+                # Then save binary copy for next time
+                if not self.SHARED_STORE and not store.save_cache(data_file, (state['size'], state['mtime']), data):
+                    self.ctrl.logger.info('Unable to write cache for data file "' + data_file + '"')
+            else:
+                self.ctrl.logger.info('Using cache for data file "' + data_file + '"')
+
+            search_index = index_data(data)
+
+            if self.SHARED_STORE:
+                # Save shared store for other sessions, then switch to it so this one's private copy is dropped
+                if store.save_shared(data_file, (state['size'], state['mtime']), data, search_index):
+                    shared = store.load_shared(data_file)
+
+                if shared is not None:
+                    data, search_index = shared
+                else:
+                    self.ctrl.logger.info('Unable to use shared store for data file "' + data_file + '"')
+
+        if build_metadata:
+
+            if metadata is None:
+                metadata = meta.build(data)  # Data came from cache or store, use what's already in memory
+
+            try:
+                meta.save(data_file, *metadata, state=state)
+            except OSError:
+                self.ctrl.logger.info('Unable to write metadata for data file "' + data_file + '"')
+
+        cube = build_cube(data) if self.USE_CUBE else None
         self.ctrl.logger.info('Done loading data file "' + data_file + '"')
+        source = (os.path.abspath(data_file), state['size'], state['mtime'])
+        return (data, search_index, cube) + metadata + (source,)
+
+    def parse_data(self, data_file, metadata, progress):
+        """Parse data file in batches, return (data, metadata), building metadata along the way if it's None"""
+        chunks = []
+        rows = 0
+        build_metadata = metadata is None
+
+        for chunk, bytes_read, bytes_total in store.read_chunks(data_file):
+            chunks.append(chunk)
+            rows += chunk.shape[0]
+
+            if build_metadata:
+                chunk_metadata = meta.build(chunk)
+                metadata = chunk_metadata if metadata is None else meta.merge(metadata, chunk_metadata)
+
+            if progress is not None:
+                progress(rows, bytes_read, bytes_total)
+
+        if not chunks:
+            return store.read_csv(data_file), metadata  # Header only
+
+        return store.combine(chunks), metadata
+
+    def set_data(self, data, search_index, cube, mods, uniques, source):
+        """Switch to newly loaded data, waiting for any search of previous data to finish"""
+        with self.lock:
+            self.data = data
+            self.source = source
+            self.search_index = search_index
+            self.searches.clear()  # Positions refer to previous data
+            self.cube = cube
+            self.mods = mods
+            self.uniques = uniques
+            self.valid = True
 
     def clear_filter_results(self):
         self.results = None
+        self.selection = None
+        self.res_cube = None
+        self.res_source = None
         self.res_row_count = 0
 
     def search(self, mod, scn, reg, ind, sec, yrs):
         """Use provided values lists to search for data"""
         self.ctrl.logger.debug('At')
 
-        # Build query string
-        self.query = (' & ' + F_MOD + ' == ' + str(mod)) if ALL not in mod else ''
-        self.query += (' & ' + F_SCN + ' == ' + str(scn)) if ALL not in scn else ''
-        self.query += (' & ' + F_REG + ' == ' + str(reg)) if ALL not in reg else ''
-        self.query += (' & ' + F_IND + ' == ' + str(ind)) if ALL not in ind else ''
-        self.query += (' & ' + F_SEC + ' == ' + str(sec)) if ALL not in sec else ''
-        self.query += (' & ' + F_YER + ' == ' + str(yrs)) if ALL not in yrs else ''
-
-        if self.query.strip() == '':
-            # Return all data
-            self.ctrl.logger.info('Query string empty. Returning ALL data.')
-            self.results = self.data
-        else:
-            # Run query
-            self.query = self.query[3:]  # Remove leading ' & '
-            self.ctrl.logger.info('Query "' + self.query + '"')
-            self.results = self.data.query(self.query)
+        # Collect criteria for fields being searched on, build query string for display
+        selection = {}
+        self.query = ''
+
+        for field, values in [(F_MOD, mod), (F_SCN, scn), (F_REG, reg), (F_IND, ind), (F_SEC, sec), (F_YER, yrs)]:
+
+            if ALL not in values:
+                selection[field] = values
+                self.query += ' & ' + field + ' == ' + str(values)
 
+        with self.lock:  # Results, cube and source all from same data
+
+            if not selection:
+                # Return all data
+                self.ctrl.logger.info('Query string empty. Returning ALL data.')
+                self.results = self.data
+            else:
+                # Run query using index
+                self.query = self.query[3:]  # Remove leading ' & '
+                self.ctrl.logger.info('Query "' + self.query + '"')
+                self.results = self.data.iloc[self.find(selection)]
+
+            self.selection = selection
+            self.res_cube = self.cube  # Results stay tied to this data even if other data is loaded later
+            self.res_source = self.source
+
+        self.res_version += 1
+        self.stages.clear()  # Tables processed from previous results won't be used again
         self.res_row_count = self.results.shape[0]
         self.ctrl.logger.info('Returned ' + str(self.res_row_count) + ' records')
 
-    def sort(self, col_list):
-        self.results = self.results.sort_values(by=col_list)
+    def find(self, selection):
+        """Get positions of rows matching selection, reusing those found by recent searches"""
+        key = selection_key(selection)
 
-    def iterate_results(self):
-        return self.results.itertuples()
+        with self.lock:
 
-    def delete_downloads(self, base_name):
-        """Remove any existing download file(s) of given name"""
-        self.ctrl.logger.debug('At')
+            if key in self.searches:
+                self.ctrl.logger.debug('Reusing search ' + str(key))
+                self.searches.move_to_end(key)
+                return self.searches[key]
 
-        for filename in glob.glob(base_name + '.*'):
-            os.remove(filename)
+            positions = self.search_index.find(selection, self.broader(selection))
+            self.searches[key] = positions
 
-    def create_download_file(self, data, file_format_ext):
-        """Prep data for export"""
-        self.ctrl.logger.debug('At')
+            # Drop least recently used, including this search if it's larger than SEARCH_BYTES on its own
+            while self.searches and (len(self.searches) > self.SEARCH_LIMIT or
+                                     sum(kept.nbytes for kept in self.searches.values()) > self.SEARCH_BYTES):
+                self.searches.popitem(last=False)
+
+            return positions
 
-        # First, to save space, delete existing download file(s)
-        self.delete_downloads(DOWNLOAD_DATA_NAME)
+    def broader(self, selection):
+        """Get (<positions>, <selection>) of narrowest recent search whose matches include all of selection's"""
+        best = None
 
-        # Create new download file
+        for key, positions in self.searches.items():
+            previous = dict(key)
 
-        filename = DOWNLOAD_DATA_NAME + file_format_ext
+            # Each field earlier search restricted must be restricted at least as much now
+            if all(field in selection and set(selection[field]) <= set(values) for field, values in previous.items()):
 
-        if file_format_ext == FORMAT_EXT_CSV:
-            data.to_csv(filename, index=False, quoting=csv.QUOTE_NONNUMERIC)
-        elif file_format_ext == FORMAT_EXT_JSON:
-            data.to_json(filename, orient='table', index=False)
-        elif file_format_ext == FORMAT_EXT_HTML:
-            data.to_html(filename, index=False)
-        elif file_format_ext == FORMAT_EXT_EXCEL:
-            data.to_excel(filename, index=False)
-        elif file_format_ext == FORMAT_EXT_HDF5:
-            data.to_hdf(filename, key='AgMIP')
-        elif file_format_ext == FORMAT_EXT_PICKLE:
-            data.to_pickle(filename)
+                if best is None or len(positions) < len(best[0]):
+                    best = (positions, previous)
+
+        return best
+
+    def results_key(self):
+        """Identify current results: data they came from and selection"""
+        return self.res_source, selection_key(self.selection)
+
+    def download_source(self, results=False):
+        """Get (<data>, <key>) for exporting all data (or results), key identifying contents for export cache"""
+
+        if results:
+            return self.results, self.results_key()
+        else:
+            with self.lock:
+                return self.data, (self.source, ())
+
+    def create_download_file(self, file_format_ext, source, progress=None):
+        """Prep data for export, calling progress(rows_done, rows_total) as file is written
+
+        Files are kept in export cache, so asking again for same source (see download_source()) in same format
+        reuses existing file.
+        """
+        self.ctrl.logger.debug('At')
+        filename, cached = export.cached_file(*source, file_format_ext=file_format_ext, progress=progress)
+
+        if cached:
+            self.ctrl.logger.info('Using cached download file "' + filename + '"')
 
         return filename
 
@@ -131,6 +285,21 @@ class Model:
 
         return options
 
+    def get_coverage(self, field):
+        """Get (<models>, <values>, <present>) for field, where present[i, j] tells if models[i] has values[j]"""
+        with self.lock:
+            mods, uniques = self.mods, self.uniques
+
+        models = sorted(mods)
+        values = sorted(value for value in uniques[field][''] if not str(value).strip() == '')
+        columns = dict((value, j) for j, value in enumerate(values))
+        present = np.zeros((len(models), len(values)), dtype=bool)
+
+        for i, model in enumerate(models):
+            present[i, [columns[value] for value in uniques[field][model] if value in columns]] = True
+
+        return models, values, present
+
     def get_uniques_for(self, field_name):
         unique_values = ()
 
@@ -151,55 +320,78 @@ class Model:
             pd.set_option('display.float_format', lambda x: format(x, self.FLOAT_FORMAT))
 
     def init_processed(self):
-        self.processed = self.results.copy(deep=True)
+        """Start new processing (pivot, fill, etc.) of results"""
+        self.processed = None
+        self.stage_key = (self.res_version,)
+
+    def stage(self, step, compute):
+        """Set processed to output of step, reusing output of same steps on same results if available"""
+        self.stage_key += (step,)
+
+        if self.stage_key in self.stages:
+            self.ctrl.logger.debug('Reusing ' + str(self.stage_key))
+            self.stages.move_to_end(self.stage_key)
+            self.processed = self.stages[self.stage_key]
+        else:
+            # NOTE Computations must return new table, since processed may be cached
+            self.processed = compute()
+            self.stages[self.stage_key] = self.processed
+
+            while len(self.stages) > self.STAGE_LIMIT:
+                self.stages.popitem(last=False)
 
     def pivot(self, x_field, pivot_field, y_field, aggfunc):
         """Create pivot table from results"""
         self.ctrl.logger.debug('x=%s pivot=%s y=%s aggf=%s' % (x_field, pivot_field, y_field, aggfunc))
+        self.stage(('pivot', x_field, pivot_field, y_field, aggfunc),
+                   lambda: self.pivot_results(x_field, pivot_field, y_field, aggfunc))
+
+    def pivot_results(self, x_field, pivot_field, y_field, aggfunc):
+        """Pivot directly from results (which pivot_table() doesn't modify), so only the pivot table is new"""
+
+        if self.res_cube is not None and cube_supports(self.selection, x_field, pivot_field, y_field, aggfunc):
+            self.ctrl.logger.debug('Using cube')
+            return pivot_cube(self.res_cube, self.selection, x_field, pivot_field, aggfunc)
 
         if aggfunc == AGGF_COUNT:
             aggfunc = count  # Translate string to func handle
 
+        # NOTE observed=True keeps unused categories from becoming empty rows/columns
         if not aggfunc == NONE_ITEM:
-            self.processed = self.processed.pivot_table(index=x_field, columns=pivot_field, values=y_field,
-                                                        aggfunc=aggfunc)
+            return self.results.pivot_table(index=x_field, columns=pivot_field, values=y_field, aggfunc=aggfunc,
+                                            observed=True)
         else:
-            self.processed = self.processed.pivot_table(index=x_field, columns=pivot_field, values=y_field)
+            return self.results.pivot_table(index=x_field, columns=pivot_field, values=y_field, observed=True)
 
     def fill(self, fill_type):
         """Fill missing data (NaNs) in processed results"""
         self.ctrl.logger.debug('fill=%s' % fill_type)
 
         if fill_type == FILL_PAD:
-            fill_type = 'nearest'
+            method = 'nearest'
             limit_direction = 'forward'
         else:
+            method = fill_type
             limit_direction = 'both'
 
-        self.processed.interpolate(inplace=True, method=fill_type, limit_direction=limit_direction)
+        self.stage(('fill', fill_type),
+                   lambda: self.processed.interpolate(method=method, limit_direction=limit_direction))
 
     def harmonize(self, base_row, base_col):
         """Harmonized pivot table based on given row and col (values)"""
         self.ctrl.logger.debug('base_row='+str(base_row)+' base_col='+str(base_col))
+        self.stage(('harmonize', base_row, base_col), lambda: self.harmonize_processed(base_row, base_col))
 
-        # Harmonize to row by creating multiplier table
-
-        results_mults = pd.DataFrame()
-
-        for col in self.processed.columns.values:
-            base = self.processed[col][base_row]
-            results_mults[col] = self.processed[col].apply(func=lambda x: x / base)
+    def harmonize_processed(self, base_row, base_col):
+        # Harmonize to row by creating multiplier table (each column divided by its value in base row)
+        results_mults = self.processed / self.processed.loc[base_row]
 
         # Harmonize to column by applying multipliers to pivot table
+        return self.processed.loc[base_row, base_col] * results_mults
 
-        results_harm = pd.DataFrame().reindex_like(self.processed)
-
-        for col in self.processed.columns.values:
-            for row in self.processed.index.values:
-                mult = results_mults[col][row]
-                results_harm[col][row] = self.processed[base_col][base_row] * mult
-
-        self.processed = results_harm
+    def plot_data(self):
+        """Get (<shown>, <other>) for drawing processed as lines, reduced to what plot can show (see detail.reduce())"""
+        return detail.reduce(self.processed)
 
     def dropna(self):
         self.processed.dropna()
@@ -207,16 +399,12 @@ class Model:
     def index(self, year, on_row=True):
         """Index pivot table based on year"""
         self.ctrl.logger.debug('At')
+        self.stage(('index', year, on_row), lambda: self.index_processed(year, on_row))
 
-        results_indexed = pd.DataFrame().reindex_like(self.processed)
-
+    def index_processed(self, year, on_row):
         if on_row:
-            for col in self.processed.columns.values:
-                for row in self.processed.index.values:
-                    results_indexed[col][row] = self.processed[col][row] / self.processed[col][year] * 100.0
+            # Divide each column by its value in year's row
+            return self.processed / self.processed.loc[year] * 100.0
         else:
-            for row in self.processed.index.values:
-                for col in self.processed.columns.values:
-                    results_indexed[col][row] = self.processed[col][row] / self.processed[year][row] * 100.0
-
-        self.processed = results_indexed
+            # Divide each row by its value in year's column
+            return self.processed.div(self.processed[year], axis=0) * 100.0
@@ -2,39 +2,33 @@
 # rcampbel@purdue.edu - 2020-07-14
 
 import plotly.graph_objs as go
-from plotly.offline import download_plotlyjs, init_notebook_mode, plot, iplot
-from IPython.display import clear_output
 
-import random # TODO remove testing code
+from scripts.constants import *
+from scripts.detail import OTHER_MIN, OTHER_MAX
 
 class Plotter:
 	PLOT_OPTIONS   = ['Values for Model(s) by Sector','(plot)','(plot)']
-	PLOT_LIMIT     =  100
 	INIT_TITLE     = '(No results.)'
 	PROMPT_TITLE   = '(Please select plot type.)'
-	UPDATE_TITLE   = 'Updating plot...'
 	PREFIX_TITLE   = '(prefix title)'
 	AXIS_TITLE_X   = 'Model'
 	AXIS_TITLE_Y   = 'Value'
 	GRID_COLOR	   = 'whitesmoke'
 	BACKGROUND	   = 'white'
+	OTHER_LABEL    = 'Other (%d)'
+	OTHER_COLOR    = 'rgba(128,128,128,0.3)'
+	TRACE_TYPES    = {
+		PLOT_TYPE_LINE  : go.Scatter
+		,PLOT_TYPE_BAR  : go.Bar
+		,PLOT_TYPE_HIST : go.Histogram
+		,PLOT_TYPE_BOX  : go.Box
+	}
 
 	def __init__(self,model):
 		self.model = model
-		init_notebook_mode(connected=False)
-		data = []
-
-		for i in range(self.PLOT_LIMIT):
-			bar = go.Bar(
-				x     = []
-				,y    = []
-				,name = ''
-			)
-			data.append(bar)
-
+		# NOTE FigureWidget brings its own plotly.js, so init_notebook_mode() isn't needed
 		self.fig = go.FigureWidget(
-			data = data
-			,layout = go.Layout(
+			layout = go.Layout(
 				title  = self.INIT_TITLE
 				,yaxis = dict(
 					title	  = self.AXIS_TITLE_Y
@@ -52,79 +46,74 @@ class Plotter:
 			)
 		)
 
-#	var bar1 = {
-#		x: ['giraffes', 'orangutans', 'monkeys'],  x    --> Model
-#		y: [20, 14, 23],                           y    --> Value
-#		name: 'SF Zoo',                            name --> Scenario
-#		type: 'bar'
-#	};
-#
-#	var bar2 = {
-#		x: ['giraffes', 'orangutans', 'monkeys'],  x    --> Model
-#		y: [12, 18, 29],                           y    --> Value
-#		name: 'LA Zoo',                            name --> Scenario
-#		type: 'bar'
-#	};
-
-#	var data = [trace1, trace2];
-
-	def draw_plot(self,plot_type,results):
-		'''Redraw plot based on new plot type and data'''
-		self.fig.layout.title = self.UPDATE_TITLE
-		self.model.sort(['Scenario','Model'])
-
-		# Clear plot data
-		for i in range(self.PLOT_LIMIT):
-			self.fig.data[i].x    = []
-			self.fig.data[i].y    = []
-			self.fig.data[i].name = ''
-
-		# Init loop state vars
-		cur   = []
-		latch = False
-		bar   = 0
-		total = 0.0
-		x     = []
-		y     = []
-
-		for row in self.model.iterate_results():
-
-			# First iteration?
-			if not latch:
-				latch = True
-				cur   = row
-
-			# Model or Scenario changed?
-			if not  (row.Model    == cur.Model and \
-					 row.Scenario == cur.Scenario ):
-
-				# Record model and total value
-				x.append(cur.Model)
-				y.append(total)
-				total = 0.0
-
-				# Record scenario
-				if not row.Scenario == cur.Scenario:
-					self.fig.data[bar].x    = x
-					self.fig.data[bar].y    = y
-					self.fig.data[bar].name = cur.Scenario
-					bar += 1
-					x    = []
-					y    = []
-
-				cur = row
-
-			total += row.Value
-
-		# Finish final one
-		if latch:
-			x.append(cur.Model)
-			y.append(total)
-			self.fig.data[bar].x    = x
-			self.fig.data[bar].y    = y
-			self.fig.data[bar].name = cur.Scenario
-
-		self.fig.layout.title = plot_type
-
-
-
+	def set_traces(self,trace_type,traces):
+		'''Show traces of given type (list of dicts of properties), updating existing traces in place where possible'''
+		keep = min(len(traces),len(self.fig.data))
+
+		if not all(isinstance(trace,trace_type) for trace in self.fig.data[:keep]):
+			keep = 0
+
+		if len(self.fig.data) > keep:
+			self.fig.data = self.fig.data[:keep]
+
+		# Only changed properties are sent to browser
+		with self.fig.batch_update():
+			for trace,props in zip(self.fig.data,traces):
+				trace.update(props)
+
+		if len(traces) > keep:
+			self.fig.add_traces([trace_type(**props) for props in traces[keep:]])
+
+	def draw_processed(self,plot_type,title,x_label,y_label):
+		'''Redraw plot from model's processed table: one trace per column, like DataFrame.plot() would draw'''
+		traces = []
+
+		if plot_type == PLOT_TYPE_LINE:
+			# Same reduced data as static plots, other series as band between two lines
+			shown,other = self.model.plot_data()
+			mode = 'lines+markers' if shown.shape[0] == self.model.processed.shape[0] else 'lines'
+
+			for column in shown.columns:
+				traces.append(dict(
+					x           = shown.index
+					,y          = shown[column].values
+					,name       = str(column)
+					,mode       = mode
+					,fill       = 'none'
+					,line       = dict(width=2)
+					,showlegend = True
+				))
+
+			if other is not None:
+				count = self.model.processed.shape[1] - shown.shape[1]
+
+				for bound,fill in [(OTHER_MIN,'none'),(OTHER_MAX,'tonexty')]:
+					traces.append(dict(
+						x           = other.index
+						,y          = other[bound].values
+						,name       = self.OTHER_LABEL % count
+						,mode       = 'lines'
+						,fill       = fill
+						,fillcolor  = self.OTHER_COLOR
+						,line       = dict(width=0)
+						,showlegend = fill == 'tonexty'
+					))
+
+		else:
+			table = self.model.processed
+
+			for column in table.columns:
+				if plot_type == PLOT_TYPE_BAR:
+					traces.append(dict(x=table.index,y=table[column].values,name=str(column)))
+				elif plot_type == PLOT_TYPE_HIST:
+					traces.append(dict(x=table[column].values,name=str(column)))
+				else:
+					traces.append(dict(y=table[column].values,name=str(column)))
+
+		self.set_traces(self.TRACE_TYPES[plot_type],traces)
+
+		with self.fig.batch_update():
+			self.fig.layout.title       = title
+			self.fig.layout.xaxis.title = x_label
+			self.fig.layout.yaxis.title = y_label
+			self.fig.layout.barmode     = 'overlay' if plot_type == PLOT_TYPE_HIST else 'group'
@@ -0,0 +1,105 @@
+# search.py - Index-based data search for AgMIP Explorer
+
+import numpy as np
+import pandas as pd
+
+from scripts.constants import *
+
+SEARCH_FIELDS = [F_MOD, F_SCN, F_REG, F_IND, F_SEC, F_YER]
+
+
+def smallest_int(limit):
+    """Smallest signed integer type able to hold values up to limit"""
+    for dtype in (np.int8, np.int16, np.int32):
+
+        if limit <= np.iinfo(dtype).max:
+            return dtype
+
+    return np.int64
+
+
+class FieldIndex:
+    """Value codes for one field, plus row positions grouped by value (see index_field())"""
+
+    def __init__(self, values, codes, order, bounds):
+        self.values = values
+        self.lookup = dict((value, code) for code, value in enumerate(values))
+        self.codes = codes  # Code of each row's value, -1 if missing
+        self.order = order  # Row positions sorted by code
+        self.bounds = bounds  # Where each code's rows start in order
+
+    def codes_for(self, values):
+        """Translate values to codes, ignoring values not present in data"""
+        return [self.lookup[value] for value in values if value in self.lookup]
+
+    def count(self, codes):
+        return sum(self.bounds[code + 1] - self.bounds[code] for code in codes)
+
+    def positions(self, codes):
+        """Sorted positions of rows having any of given codes"""
+        parts = [self.order[self.bounds[code]:self.bounds[code + 1]] for code in codes]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=self.order.dtype)
+
+    def matches(self, positions, codes):
+        """Boolean mask: which of given rows have any of given codes"""
+        table = np.zeros(len(self.bounds), dtype=bool)  # Extra (last) slot catches code -1
+        table[codes] = True
+        return table[self.codes[positions]]
+
+
+class SearchIndex:
+    """Per-field indexes over a dataset (see index_data())"""
+
+    def __init__(self, fields):
+        self.fields = fields
+
+    def find(self, selection, broader=None):
+        """Get sorted positions of rows matching selection, a dict of field -> accepted values
+
+        Broader, if given, is (<positions>, <selection>) from an earlier search whose matches include all of these.
+        Its positions are narrowed down instead when that's less work than starting from the most selective field.
+        """
+        clauses = []
+
+        for field, values in selection.items():
+            index = self.fields[field]
+            codes = index.codes_for(values)
+            clauses.append((index.count(codes), field, codes))
+
+        clauses.sort()
+
+        if broader is not None and len(broader[0]) <= clauses[0][0]:
+            # Start with earlier matches, then only check fields whose values have changed since
+            positions, previous = broader
+            clauses = [clause for clause in clauses
+                       if not (clause[1] in previous and set(selection[clause[1]]) == set(previous[clause[1]]))]
+        else:
+            # Start with most selective field, then only look at rows it matched
+            _, field, codes = clauses[0]
+            positions = self.fields[field].positions(codes)
+            clauses = clauses[1:]
+
+        for _, field, codes in clauses:
+            positions = positions[self.fields[field].matches(positions, codes)]
+
+        return positions
+
+
+def index_field(series):
+    """Build index for one column, reusing codes of category columns rather than keeping a copy"""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, values = series.values.codes, series.cat.categories  # View of column's own codes, -1 if missing
+    else:
+        codes, values = pd.factorize(series, sort=True)  # Missing values get code -1
+
+        # Small codes also let argsort use radix sort, so build cost stays linear
+        codes = codes.astype(smallest_int(len(values)))
+
+    order = np.argsort(codes, kind='stable').astype(smallest_int(len(codes)))
+    bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+    return FieldIndex(values.tolist(), codes, order, bounds)
+
+
+def index_data(data):
+    """Build indexes for dataset, done once when it loads"""
+    return SearchIndex(dict((field, index_field(data[field])) for field in SEARCH_FIELDS))
@@ -0,0 +1,212 @@
+# store.py - On-disk caches for AgMIP Explorer data files
+
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from scripts.constants import *
+from scripts.search import FieldIndex, SearchIndex
+
+CACHE_EXT = '.cache'
+CACHE_VERSION = 3  # Increment when layout of cached frame changes
+CHUNK_ROWS = 1000000  # Rows parsed per batch when reading data files
+SHARED_EXT = '.columns'  # Directory holding shared (memory-mapped) store
+SHARED_HEADER = 'header.pickle'
+ARRAY_EXT = '.npy'
+INDEX_PARTS = ['codes', 'order', 'bounds']  # Arrays of each FieldIndex
+
+# Declared schema (see README): dimension fields as categories, Year narrowed after parsing
+DTYPES = dict([(field, 'category') for field in DIMS] + [(F_VAL, 'float64')])
+
+
+def signature(data_file):
+    """Identify version of a data file by its size and modification time"""
+    meta = os.stat(data_file)
+    return meta.st_size, meta.st_mtime
+
+
+def cache_name(data_file):
+    return os.path.splitext(data_file)[0] + CACHE_EXT
+
+
+def compact_year(data):
+    """Narrow Year to smallest integer type (left as float if any values are missing)"""
+    data[F_YER] = pd.to_numeric(data[F_YER], downcast='integer')
+    return data
+
+
+def read_chunks(data_file):
+    """Parse data file in batches using declared schema, yield (<compact frame>, bytes_read, bytes_total)"""
+    bytes_total = os.path.getsize(data_file)
+
+    with open(data_file, 'rb') as f:
+
+        for chunk in pd.read_csv(f, dtype=DTYPES, chunksize=CHUNK_ROWS):
+            yield compact_year(chunk), min(f.tell(), bytes_total), bytes_total
+
+
+def matching_categories(parts):
+    """Give categoricals with no categories (column empty in that batch) the categories dtype of the others"""
+    dtype = next((part.categories.dtype for part in parts if len(part.categories) > 0), None)
+
+    if dtype is None:
+        return parts
+
+    return [part if len(part.categories) > 0 else part.set_categories(part.categories.astype(dtype))
+            for part in parts]
+
+
+def combine(chunks):
+    """Join compact frames into one, releasing each column of the pieces as soon as it's copied"""
+    columns = {}
+
+    for field in chunks[0].columns:
+
+        if field in DIMS:
+            # Chunks have their own categories, so merge those rather than falling back to strings
+            columns[field] = union_categoricals(matching_categories([chunk[field].values for chunk in chunks]),
+                                                sort_categories=True)
+        else:
+            columns[field] = np.concatenate([chunk[field].values for chunk in chunks])
+
+        for chunk in chunks:
+            del chunk[field]
+
+    return compact_year(pd.DataFrame(columns))
+
+
+def read_csv(data_file):
+    """Parse data file using declared schema"""
+    chunks = [chunk for chunk, _, _ in read_chunks(data_file)]
+    return combine(chunks) if chunks else compact_year(pd.read_csv(data_file, dtype=DTYPES))
+
+
+def load_cache(data_file):
+    """Return cached frame for data file, or None if cache is missing or stale"""
+
+    # noinspection PyBroadException
+    try:
+        with open(cache_name(data_file), 'rb') as f:
+
+            # Signature is stored first so stale caches are rejected without reading the frame
+            if not pickle.load(f) == (CACHE_VERSION,) + signature(data_file):
+                return None
+
+            return pickle.load(f)
+    except Exception:
+        return None  # Missing, partial, or written by incompatible library versions
+
+
+def save_cache(data_file, sig, data):
+    """Write frame to binary cache next to data file, tagged with data file's signature"""
+    temp_name = cache_name(data_file) + '.tmp'
+
+    try:
+        with open(temp_name, 'wb') as f:
+            pickle.dump((CACHE_VERSION,) + sig, f, pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temp_name, cache_name(data_file))  # Readers never see a partial cache
+        return True
+    except OSError:
+
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+
+        return False  # E.g. data directory is read-only
+
+
+def shared_name(data_file):
+    return os.path.splitext(data_file)[0] + SHARED_EXT
+
+
+def save_shared(data_file, sig, data, search_index):
+    """Write data and its search index as directory of arrays that sessions can map, see load_shared()"""
+    directory = shared_name(data_file)
+    header = {'signature': (CACHE_VERSION,) + sig, 'columns': list(data.columns), 'categories': {}, 'index': {}}
+
+    try:
+        # Own directory for each save, so concurrent saves (other sessions or jobs) don't touch each other's files
+        temp_dir = tempfile.mkdtemp(dir=os.path.dirname(directory) or '.',
+                                    prefix=os.path.basename(directory) + '.tmp')
+    except OSError:
+        return False  # E.g. data directory is read-only
+
+    try:
+        os.chmod(temp_dir, 0o755)  # Readable by other sessions, like a directory made by os.makedirs()
+
+        for field in data.columns:
+
+            if field in DIMS:
+                header['categories'][field] = data[field].cat.categories.tolist()
+                np.save(os.path.join(temp_dir, field + ARRAY_EXT), data[field].cat.codes.values)
+            else:
+                np.save(os.path.join(temp_dir, field + ARRAY_EXT), data[field].values)
+
+        for field, index in search_index.fields.items():
+            header['index'][field] = index.values
+
+            for part in INDEX_PARTS:
+
+                if not (part == 'codes' and field in DIMS):  # Category columns' codes are the column array itself
+                    np.save(os.path.join(temp_dir, field + '.' + part + ARRAY_EXT), getattr(index, part))
+
+        with open(os.path.join(temp_dir, SHARED_HEADER), 'wb') as f:
+            pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+
+        # Swap in new store (sessions still mapping an old one keep their open files)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+
+        os.rename(temp_dir, directory)
+        return True
+    except OSError:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return False  # E.g. data directory is read-only, or another session just saved the store
+
+
+def load_shared(data_file):
+    """Map data file's shared store read-only, return (data, search_index), or None if store is missing or stale
+
+    Pages of a mapped store are shared by all sessions using it, rather than each session holding its own copy.
+    """
+    directory = shared_name(data_file)
+
+    # noinspection PyBroadException
+    try:
+        with open(os.path.join(directory, SHARED_HEADER), 'rb') as f:
+            header = pickle.load(f)
+
+        if not header['signature'] == (CACHE_VERSION,) + signature(data_file):
+            return None
+
+        columns = {}
+
+        for field in header['columns']:
+            array = np.load(os.path.join(directory, field + ARRAY_EXT), mmap_mode='r')
+
+            if field in header['categories']:
+                columns[field] = pd.Categorical.from_codes(array, categories=header['categories'][field])
+            else:
+                columns[field] = array
+
+        fields = {}
+
+        for field, values in header['index'].items():
+            arrays = dict((part, np.load(os.path.join(directory, field + '.' + part + ARRAY_EXT), mmap_mode='r'))
+                          for part in INDEX_PARTS if not (part == 'codes' and field in header['categories']))
+
+            if field in header['categories']:
+                arrays['codes'] = columns[field].codes  # Same mapped codes as column
+
+            fields[field] = FieldIndex(values, **arrays)
+
+        # NOTE Categories keep the mapped codes; older pandas copies numeric columns into its own blocks regardless
+        return pd.DataFrame(columns, copy=False), SearchIndex(fields)
+    except Exception:
+        return None  # Missing, partial, or written by incompatible library versions
@@ -0,0 +1,34 @@
+# surface.py - Reusable matplotlib figure for an output widget, so replots don't pile up new figures
+
+import io
+
+from matplotlib.figure import Figure
+from IPython.core.display import display, clear_output
+from IPython.display import Image
+
+
+class Surface:
+    """One figure and axes kept for an output widget, cleared and drawn on again for each plot
+
+    Figure is created directly rather than via pyplot, so it's never held in pyplot's registry and there's nothing
+    to close: it's released along with its surface.
+    """
+
+    def __init__(self, output, figsize):
+        self.output = output
+        self.figure = Figure(figsize=figsize)
+        self.ax = self.figure.add_subplot(1, 1, 1)
+
+    def axes(self):
+        """Get axes, emptied of previous plot"""
+        self.ax.clear()
+        return self.ax
+
+    def show(self):
+        """Replace output widget contents with image of figure"""
+        image = io.BytesIO()
+        self.figure.savefig(image, format='png', bbox_inches='tight')
+
+        with self.output:
+            clear_output(wait=True)
+            display(Image(data=image.getvalue(), format='png'))
@@ -2,10 +2,12 @@
 # rcampbel@purdue.edu - 2020-07-14
 
 import ipywidgets as ui
+import numpy as np
 from IPython.core.display import display
-from IPython.display import FileLink
+from IPython.display import FileLink, HTML
 
 from scripts.constants import *
+from scripts.export import supports
 
 
 def section(title, contents):
@@ -26,6 +28,8 @@ class View:
     EMPTY = ''
     DATA_NONE = '(No data loaded.)'
     DATA_LOAD = 'Loading data...\nThis might take a few moments.'
+    DATA_LOAD_FAILED = 'Unable to load data file. Please see log for details.'
+    DATA_LOAD_PROGRESS = 'Read <b>%s</b> records (%.2f of %.2f GB)'
     DATA_INTRO = 'Here is an overview of the current full dataset:'
     USING_TITLE = 'Using This App'
     USING_TEXT = '''<p>
@@ -51,12 +55,14 @@ class View:
     CRITERIA_TITLE = 'Data Selection'
     CRITERIA_APPLY = 'Search'
     OUTPUT_TITLE = 'Results'
-    OUTPUT_PRE = 'Limit display to '
-    OUTPUT_POST = 'lines'
+    OUTPUT_PRE = 'Show '
+    OUTPUT_POST = 'lines per page'
+    OUTPUT_PAGE = 'Lines <b>%s</b> to <b>%s</b>'
     EXPORT_BULK_TITLE = 'Export Entire Dataset'
     EXPORT_RESULTS_TITLE = 'Export All Results'
     EXPORT_PLOT_TITLE = 'Export Plot Image'
     EXPORT_BUTTON = 'Create Download '
+    EXPORT_SETS_BUTTON = 'Download All Plot Sets (.zip)'
     EXPORT_LINK_PROMPT = "Click here to save file: "
 
     PLOT_STATUS_TEMPLATE = """
@@ -74,6 +80,8 @@ class View:
     PLOT_X_LABEL = 'X Axis:'
     PLOT_Y_LABEL = 'Y Axis:'
     PLOT_TYPE_LABEL = 'Plot Type:'
+    PLOT_BACKEND_LABEL = 'Display:'
+    PLOT_BACKENDS = [('Image', PLOT_BACKEND_STATIC), ('Interactive', PLOT_BACKEND_INTERACTIVE)]
     PLOT_PIVOT_LABEL = 'Pivot on Field:'
     PLOT_AGGFUNC_LABEL = 'Pivot Aggregation:'
     PLOT_FILL_LABEL = 'Fill missing:'
@@ -91,13 +99,18 @@ class View:
     PIVOT_TITLE = 'Plot Data'
 
     DOWNLOAD_DATA_FORMAT_LABEL = 'File Format:'
-    DOWNLOAD_DATA_FORMAT_OPTIONS = [
+    DOWNLOAD_DATA_FORMAT_OPTIONS = [option for option in [
         ('CSV, Comma Separated (.csv)', FORMAT_EXT_CSV),
+        ('CSV, gzip Compressed (.csv.gz)', FORMAT_EXT_CSV_GZ),
+        ('CSV, Zstandard Compressed (.csv.zst)', FORMAT_EXT_CSV_ZST),
+        ('Parquet, Columnar (.parquet)', FORMAT_EXT_PARQUET),
+        ('Feather, Arrow IPC (.feather)', FORMAT_EXT_FEATHER),
         ('JSON (.json)', FORMAT_EXT_JSON),
+        ('JSON Lines (.jsonl)', FORMAT_EXT_JSONL),
         ('HTML (.html)', FORMAT_EXT_HTML),
         ('Excel (.xls)', FORMAT_EXT_EXCEL),
         ('HDF5 (.h5)', FORMAT_EXT_HDF5),
-        ('Pickle, Python (.pickle)', FORMAT_EXT_PICKLE)]
+        ('Pickle, Python (.pickle)', FORMAT_EXT_PICKLE)] if supports(option[1])]  # Omit formats lacking libraries
 
     DOWNLOAD_PLOT_FORMAT_LABEL = 'Image Format:'
     DOWNLOAD_PLOT_FORMAT_OPTIONS = [
@@ -117,6 +130,22 @@ class View:
 
     DATA_PRESENT_DESC = '&nbsp;Data contains records with model and field value'
     DATA_ABSENT_DESC = '&nbsp;No records exist for given model and field value'
+    COVER_FIELDS = FIELDS[1:-1]  # ['Scenario', 'Year', 'Sector', 'Region', 'Indicator', 'Unit']
+    COVER_LEGEND = '''
+        <style>
+            .vert {
+                writing-mode: vertical-rl;
+                transform: rotate(180deg);
+            }
+            .bot {
+                vertical-align: bottom;
+                line-height: 110%;
+            }
+        </style>
+        <div style="margin:20px">
+            <p>&nbsp;&nbsp;&nbsp;''' + DATA_PRESENT_INDICATOR + DATA_PRESENT_DESC + '''</p>
+            <p>&nbsp;&nbsp;&nbsp;''' + DATA_ABSENT_INDICATOR + DATA_ABSENT_DESC + '''</p>
+        </div>'''
 
     def __init__(self):
         # MVC objects
@@ -131,8 +160,11 @@ class View:
 
         # Data source, overview, download, and coverage
         self.data_ddn_src = None
+        self.data_load_progress = None
+        self.data_load_text = None
         self.desc_output = None
-        self.cover_output = None
+        self.cover_html = None
+        self.cover_fields = None
         self.data_btn_refexp = None
         self.data_out_export = None
         self.data_ddn_format = None
@@ -146,6 +178,10 @@ class View:
         self.filter_reg = None
         self.filter_btn_apply = None
         self.filter_ddn_ndisp = None
+        self.filter_btn_prev = None
+        self.filter_btn_next = None
+        self.filter_page_html = None
+        self.filter_page = 0  # Page of results being displayed
         self.filter_output = None
         self.filter_btn_refexp = None
         self.filter_out_export = None
@@ -163,10 +199,12 @@ class View:
         self.viz_btn_plot_generate = None
         self.viz_ddn_plot_fill = None
         self.viz_ddn_plot_set = None
+        self.viz_ddn_plot_backend = None
         self.viz_out_plot_data = None
         self.viz_ddn_plot_harm_row = None
         self.viz_ddn_plot_harm_col = None
         self.viz_btn_plot_refexp = None
+        self.viz_btn_plot_sets_exp = None
         self.viz_out_plot_export = None
         self.viz_ddn_plot_format = None
         self.viz_ckb_plot_index = None
@@ -189,8 +227,7 @@ class View:
             display(self.tabs)
 
     def debug(self, text):
-        with self.debug_output:
-            print(text)
+        self.debug_output.append_stdout(text + '\n')  # Safe to call from background jobs
 
     def build(self):
         """Create user interface"""
@@ -218,8 +255,12 @@ class View:
     def data(self):
         """Create widgets for data tab content"""
         self.data_ddn_src = ui.Dropdown(options=self.model.get_data_options(), value=None)
+        self.data_load_progress = ui.FloatProgress(min=0.0, max=1.0, layout=ui.Layout(width='20%',
+                                                                                      visibility='hidden'))
+        self.data_load_text = ui.HTML('')
         self.desc_output = ui.Output(layout={'border': '1px solid black'})
-        self.cover_output = ui.Output(layout={'border': '1px solid black'})
+        self.cover_html = ui.HTML('&nbsp;')
+        self.cover_fields = ui.Accordion(layout={'border': '1px solid black'})
         self.data_btn_refexp = ui.Button(description=self.EXPORT_BUTTON, icon='download', layout=self.LO20)
         self.data_out_export = ui.Output(layout={'border': '1px solid black'})
         self.data_ddn_format = ui.Dropdown(value=self.DOWNLOAD_DATA_FORMAT_OPTIONS[0][1],
@@ -229,11 +270,11 @@ class View:
 
         content = []
 
-        row = [ui.HTML(value=self.DDN_PROMPT), self.data_ddn_src]
+        row = [ui.HTML(value=self.DDN_PROMPT), self.data_ddn_src, self.data_load_progress, self.data_load_text]
 
         content.append(section(self.DATA_SOURCE_TITLE, [ui.HBox(row)]))
         content.append(section(self.DATA_OVERVIEW_TITLE, [ui.VBox([self.desc_output])]))
-        content.append(section(self.DATA_COVERAGE_TITLE, [ui.VBox([self.cover_output])]))
+        content.append(section(self.DATA_COVERAGE_TITLE, [ui.VBox([self.cover_html, self.cover_fields])]))
 
         # Bulk download
 
@@ -272,7 +313,10 @@ class View:
 
         # Create other widgets
         self.filter_btn_apply = ui.Button(description=self.CRITERIA_APPLY, icon='search', layout=self.LO20)
-        self.filter_ddn_ndisp = ui.Dropdown(options=['25', '50', '100', ALL], layout=self.LO10)
+        self.filter_ddn_ndisp = ui.Dropdown(options=['25', '50', '100', '500'], layout=self.LO10)
+        self.filter_btn_prev = ui.Button(icon='chevron-left', tooltip='Previous page', layout=ui.Layout(width='40px'))
+        self.filter_btn_next = ui.Button(icon='chevron-right', tooltip='Next page', layout=ui.Layout(width='40px'))
+        self.filter_page_html = ui.HTML('')
         self.filter_output = ui.Output()
         self.filter_btn_refexp = ui.Button(description=self.EXPORT_BUTTON, icon='download', layout=self.LO20)
         self.filter_out_export = ui.Output(layout={'border': '1px solid black'})
@@ -308,7 +352,10 @@ class View:
         row = [self.filter_nrec_output,
                ui.HTML('</span><div style="text-align: right;">' + self.OUTPUT_PRE + '</div>', layout=self.LO15),
                self.filter_ddn_ndisp,
-               ui.HTML('<div style="text-align: left;">' + self.OUTPUT_POST + '</div>', layout=self.LO10)]
+               ui.HTML('<div style="text-align: left;">' + self.OUTPUT_POST + '</div>', layout=self.LO10),
+               self.filter_btn_prev,
+               self.filter_page_html,
+               self.filter_btn_next]
         widgets.append(ui.HBox(row))
 
         widgets.append(ui.HBox([self.filter_output], layout={'width': '90vw'}))
@@ -347,7 +394,10 @@ class View:
         spacer = ui.Label(value='    ', layout=self.LO10)
         self.viz_btn_plot_generate = ui.Button(description=self.PLOT_GENERATE_LABEL, icon='line-chart', disabled=True,
                                                layout=ui.Layout(width='auto'))
-        widgets.append(ui.HBox([label, self.viz_ddn_plot_set, spacer, self.viz_btn_plot_generate]))
+        self.viz_ddn_plot_backend = ui.Dropdown(options=self.PLOT_BACKENDS, layout=self.LO15)
+        widgets.append(ui.HBox([label, self.viz_ddn_plot_set, spacer, self.viz_btn_plot_generate,
+                                ui.Label(value='    ', layout=self.LO10),
+                                ui.Label(value=self.PLOT_BACKEND_LABEL), self.viz_ddn_plot_backend]))
 
         # Settings grid
         w1 = ui.Label(value=self.PLOT_TYPE_LABEL,
@@ -411,12 +461,15 @@ class View:
         self.viz_ddn_plot_format = ui.Dropdown(value=self.DOWNLOAD_PLOT_FORMAT_OPTIONS[0][1],
                                                options=self.DOWNLOAD_PLOT_FORMAT_OPTIONS, layout=self.LO25)
         self.viz_btn_plot_refexp = ui.Button(description=self.EXPORT_BUTTON, icon='download', layout=self.LO20)
+        self.viz_btn_plot_sets_exp = ui.Button(description=self.EXPORT_SETS_BUTTON, icon='download', layout=self.LO25)
         self.viz_out_plot_export = ui.Output(layout={'border': '1px solid black'})
         spacer = ui.Label(value='    ', layout=self.LO10)
         row = ui.HBox([ui.Label(value=self.DOWNLOAD_PLOT_FORMAT_LABEL, layout=self.LO10),
                        self.viz_ddn_plot_format,
                        spacer,
-                       self.viz_btn_plot_refexp])
+                       self.viz_btn_plot_refexp,
+                       spacer,
+                       self.viz_btn_plot_sets_exp])
         widgets = [ui.VBox([row, spacer, self.viz_out_plot_export])]
         content.append(section(self.EXPORT_PLOT_TITLE, widgets))
 
@@ -435,79 +488,64 @@ class View:
 
     def update_data_status(self, content):
         """Change text in data overview section of data tab"""
-        self.desc_output.clear_output(wait=True)
-
-        with self.desc_output:
-
-            if isinstance(content, str):
-                # noinspection PyTypeChecker
-                display(ui.HTML(content))
-            else:
-                # Content is dataframe, will show nice html summary
-                self.model.set_disp(limit=10)
-                display(content)
+        # NOTE Sets outputs directly rather than using "with <output>:" since this is called from background jobs
+        self.desc_output.outputs = ()
 
-        # Display data coverage tables
-
-        self.cover_output.clear_output(wait=True)
+        if isinstance(content, str):
+            self.desc_output.append_display_data(HTML(content))
+        else:
+            # Content is dataframe, will show nice html summary
+            self.model.set_disp(limit=10)
+            self.desc_output.append_display_data(content)
 
-        html = '&nbsp;'
+        # Display data coverage legend, tables are rendered when their section is opened (see show_coverage())
+        self.cover_fields.selected_index = None
+        self.cover_fields.children = ()
 
         if (not isinstance(content, str)) and self.model.valid:
+            self.cover_html.value = self.COVER_LEGEND
+            self.cover_fields.children = [ui.HTML('') for _ in self.COVER_FIELDS]
 
-            # First, initialize output by defining styles for table elements
-            html = '''
-                <style>
-                    .vert {
-                        writing-mode: vertical-rl;
-                        transform: rotate(180deg);
-                    }
-                    .bot {
-                        vertical-align: bottom;
-                        line-height: 110%;
-                    }
-                </style>'''
-
-            # Add legend - covers all tables
-            html += '<div style="margin:20px">'
-            html += '<p></p>'
-            html += '<p>&nbsp;&nbsp;&nbsp;' + self.DATA_PRESENT_INDICATOR + self.DATA_PRESENT_DESC + '</p>'
-            html += '<p>&nbsp;&nbsp;&nbsp;' + self.DATA_ABSENT_INDICATOR + self.DATA_ABSENT_DESC + '</p>'
-
-            # One table for each field
-            for field in FIELDS[1:-1]:  # ['Scenario', 'Year', 'Sector', 'Region', 'Indicator', 'Unit']:
-
-                html += '<table line-height="110%"><tr><td><b>' + field + '</b>&nbsp;</td>'
+            for i, field in enumerate(self.COVER_FIELDS):
+                self.cover_fields.set_title(i, field)
+        else:
+            self.cover_html.value = '&nbsp;'
 
-                # Column headers: values for field
-                for item in sorted(self.model.uniques[field]['']):
+    def show_coverage(self, index):
+        """Fill in coverage table for field at given position in coverage sections, unless already done"""
+        self.ctrl.logger.debug('At')
 
-                    if not str(item).strip() == '':
-                        html += '<td class="bot"><div class="vert"><span>&nbsp;' + str(item) + '</span></div></td>'
+        if index is None or not self.cover_fields.children[index].value == '':
+            return
 
-                html += '</tr>'
+        models, values, present = self.model.get_coverage(self.COVER_FIELDS[index])
 
-                # Rows: models
-                for model in sorted(self.model.mods):
-                    html += '<tr style="line-height:150%;"><td style="text-align:right;">' + model + '&nbsp;&nbsp' \
-                                                                                                     ';&nbsp;</td> '
-                    # Columns: data absent/present indicators
-                    for item in self.model.uniques[field]['']:
+        # Build all cells at once, then join them row by row
+        cells = np.where(present, '<td>' + self.DATA_PRESENT_INDICATOR + '</td>',
+                         '<td>' + self.DATA_ABSENT_INDICATOR + '</td>')
 
-                        if item in self.model.uniques[field][model]:
-                            html += '<td>' + self.DATA_PRESENT_INDICATOR + '</td>'
-                        else:
-                            html += '<td>' + self.DATA_ABSENT_INDICATOR + '</td>'
+        html = '<table line-height="110%"><tr><td><b>' + self.COVER_FIELDS[index] + '</b>&nbsp;</td>'
+        html += ''.join('<td class="bot"><div class="vert"><span>&nbsp;' + str(value) + '</span></div></td>'
+                        for value in values)
+        html += '</tr>'
+        html += ''.join('<tr style="line-height:150%;"><td style="text-align:right;">' + model +
+                        '&nbsp;&nbsp;&nbsp;</td>' + ''.join(row) + '</tr>' for model, row in zip(models, cells))
+        html += '</table>'
 
-                    html += '</tr>'
+        self.cover_fields.children[index].value = html
 
-                html += '</table><br>'
+    def reset_load_progress(self):
+        """Hide progress of data file load and clear its text, so previous load's progress isn't left showing"""
+        self.data_load_progress.layout.visibility = 'hidden'
+        self.data_load_progress.value = 0.0
+        self.data_load_text.value = ''
 
-            html += '</div>'
-
-        with self.cover_output:
-            # noinspection PyTypeChecker
-            display(ui.HTML(html))
+    def update_load_progress(self, rows, bytes_read, bytes_total):
+        """Show how much of data file has been read so far"""
+        self.data_load_progress.layout.visibility = 'visible'
+        self.data_load_progress.value = bytes_read / bytes_total if bytes_total > 0 else 1.0
+        self.data_load_text.value = self.DATA_LOAD_PROGRESS % (format(rows, ','), bytes_read / (1024 ** 3),
+                                                              bytes_total / (1024 ** 3))
 
     def update_dynamic_selections(self):
         """Populate non-static selection option widgets based on new data"""
@@ -551,22 +589,25 @@ class View:
 
             return [ALL] + sorted(list(set.intersection(*setlist)))
 
-    def update_filtered_output(self):
-        """Display new data in filtered output"""
+    def update_filtered_output(self, page=0):
+        """Display given page of new data in filtered output, only that page's rows are rendered"""
 
         self.filter_nrec_output.value = 'Total: <b>' + format(self.model.res_row_count, ',') + '</b> records'
+        limit = int(self.filter_ddn_ndisp.value)
+        last_page = max(0, (self.model.res_row_count - 1) // limit)
+        self.filter_page = min(max(0, page), last_page)
+        self.filter_btn_prev.disabled = self.filter_page == 0
+        self.filter_btn_next.disabled = self.filter_page == last_page
 
         if self.model.res_row_count < 1:
+            self.filter_page_html.value = ''
             self.output(self.EMPTY_LIST_MSG, self.filter_output)
         else:
-            # Calc output line limit
-            if self.filter_ddn_ndisp.value == ALL:
-                limit = self.model.res_row_count
-            else:
-                limit = int(self.filter_ddn_ndisp.value)
-
+            start = self.filter_page * limit
+            end = min(start + limit, self.model.res_row_count)
+            self.filter_page_html.value = self.OUTPUT_PAGE % (format(start + 1, ','), format(end, ','))
             self.model.set_disp(limit=limit)
-            self.output(self.model.results.head(limit), self.filter_output)
+            self.output(self.model.results.iloc[start:end], self.filter_output)
 
     def set_plot_status(self):
         """Change status of plot-related widgets based on availability of filter results"""
@@ -584,24 +625,20 @@ class View:
         self.set_harmonize(disable=True)
 
     def export_msg(self, text, output):
-        """Clear export output area then write text to it"""
+        """Replace contents of export output area with text (safe to call from background jobs)"""
         self.ctrl.logger.debug('At')
-        output.clear_output()
+        output.outputs = ()
+        output.append_display_data(HTML('<p>' + text + '</p>'))
 
-        with output:
-            # noinspection PyTypeChecker
-            display(ui.HTML('<p>' + text + '</p>'))
+    def export_progress(self, rows, total, output):
+        """Replace contents of export output area with count of records written so far"""
+        self.export_msg(CREATING_FILE % (format(rows, ','), format(total, ',')), output)
 
     def export_link(self, filepath, output):
-        """Create data URI link and add it to export output area"""
+        """Replace contents of export output area with link to file (safe to call from background jobs)"""
         self.ctrl.logger.debug('At')
-        output.clear_output()
-
-        link = FileLink(filepath, result_html_prefix=self.EXPORT_LINK_PROMPT)
-
-        with output:
-            # noinspection PyTypeChecker
-            display(link)
+        output.outputs = ()
+        output.append_display_data(FileLink(filepath, result_html_prefix=self.EXPORT_LINK_PROMPT))
 
     def output(self, content, widget):
         """Reset output area with contents (text or data)"""
@@ -0,0 +1,39 @@
+# test_detail.py - Level of detail reduction keeps plots near MAX_POINTS rows, including their extremes
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts import detail
+
+
+def random_walks(rows, columns, seed=0):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame(rng.standard_normal((rows, columns)).cumsum(axis=0), index=np.arange(2000, 2000 + rows))
+
+
+@pytest.mark.parametrize('rows, columns', [(5000, 1), (5000, 3), (5000, 25), (20000, 25), (100000, 200)])
+def test_reduced_rows_near_max_points(rows, columns):
+    shown, other = detail.reduce(random_walks(rows, columns))
+    assert shown.shape[0] <= detail.MAX_POINTS + 2  # First and last rows are always kept
+    assert other is None or other.shape[0] == shown.shape[0]
+
+
+def test_extremes_kept():
+    table = random_walks(20000, 25)
+    shown, other = detail.reduce(table)
+
+    for column in shown.columns:
+        assert shown[column].max() == table[column].max()
+        assert shown[column].min() == table[column].min()
+
+    rest = table[[column for column in table.columns if column not in shown.columns]]
+    assert other[detail.OTHER_MAX].max() == rest.max(axis=1).max()
+    assert other[detail.OTHER_MIN].min() == rest.min(axis=1).min()
+
+
+def test_short_table_unchanged():
+    table = random_walks(500, 5)
+    shown, other = detail.reduce(table)
+    pd.testing.assert_frame_equal(shown, table)
+    assert other is None
@@ -0,0 +1,95 @@
+# test_model_processing.py - Compare Model's harmonize and index steps with the loop code they replaced
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.model import Model
+
+
+def old_harmonize(processed, base_row, base_col):
+    """Loop implementation Model.harmonize() used to have (cells set with .at, same arithmetic)"""
+    results_mults = pd.DataFrame()
+
+    for col in processed.columns.values:
+        base = processed[col][base_row]
+        results_mults[col] = processed[col].apply(func=lambda x: x / base)
+
+    results_harm = pd.DataFrame().reindex_like(processed)
+
+    for col in processed.columns.values:
+        for row in processed.index.values:
+            mult = results_mults[col][row]
+            results_harm.at[row, col] = processed[base_col][base_row] * mult
+
+    return results_harm
+
+
+def old_index(processed, year, on_row):
+    """Loop implementation Model.index() used to have (cells set with .at, same arithmetic)"""
+    results_indexed = pd.DataFrame().reindex_like(processed)
+
+    if on_row:
+        for col in processed.columns.values:
+            for row in processed.index.values:
+                results_indexed.at[row, col] = processed[col][row] / processed[col][year] * 100.0
+    else:
+        for row in processed.index.values:
+            for col in processed.columns.values:
+                results_indexed.at[row, col] = processed[col][row] / processed[year][row] * 100.0
+
+    return results_indexed
+
+
+def sample_pivot(rows, columns, seed):
+    """Pivot-like table of positive values, with some missing cells (but none in first row or column)"""
+    rng = np.random.RandomState(seed)
+    values = rng.uniform(0.5, 500.0, (len(rows), len(columns)))
+    values[rng.uniform(size=values.shape) < 0.2] = np.nan
+    values[0, :] = rng.uniform(0.5, 500.0, len(columns))
+    values[:, 0] = rng.uniform(0.5, 500.0, len(rows))
+    return pd.DataFrame(values, index=pd.Index(rows), columns=pd.Index(columns))
+
+
+PIVOTS = [
+    sample_pivot(list(range(2000, 2011)), ['Model A', 'Model B', 'Model C', 'Model D'], 1),  # Year by Model
+    sample_pivot(['Model A', 'Model B', 'Model C'], ['SSP1', 'SSP2', 'SSP3', 'SSP5'], 2),  # Model by Scenario
+    sample_pivot(['SSP1', 'SSP2', 'SSP3'], list(range(2000, 2031, 5)), 3),  # Scenario by Year
+]
+
+
+def model_with(processed):
+    model = Model()
+    model.processed = processed.copy()
+    return model
+
+
+@pytest.mark.parametrize('pivot', PIVOTS)
+def test_harmonize_matches_loops(pivot):
+    for base_row in pivot.index:
+        for base_col in pivot.columns:
+            expected = old_harmonize(pivot, base_row, base_col)
+            actual = model_with(pivot).harmonize_processed(base_row, base_col)
+            pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+
+@pytest.mark.parametrize('pivot', PIVOTS)
+def test_index_on_row_matches_loops(pivot):
+    for year in pivot.index:
+        expected = old_index(pivot, year, True)
+        actual = model_with(pivot).index_processed(year, True)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+
+@pytest.mark.parametrize('pivot', PIVOTS)
+def test_index_on_column_matches_loops(pivot):
+    for year in pivot.columns:
+        expected = old_index(pivot, year, False)
+        actual = model_with(pivot).index_processed(year, False)
+        pd.testing.assert_frame_equal(actual, expected, check_exact=True)
+
+
+def test_missing_cells_stay_missing():
+    pivot = PIVOTS[0]
+    harmonized = model_with(pivot).harmonize_processed(pivot.index[0], pivot.columns[0])
+    assert harmonized.isna().equals(pivot.isna())